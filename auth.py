@@ -1,11 +1,20 @@
 import secrets
 import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
 from datetime import datetime
+from typing import NamedTuple
+from urllib.parse import parse_qsl
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
+from config import get_settings
 from database import AccessKey, User
 
+settings = get_settings()
+
 
 def generate_key(prefix: str = "SK") -> str:
     raw = secrets.token_hex(6).upper()
@@ -18,12 +27,12 @@ async def get_user_by_tg(db: AsyncSession, tg_id: int) -> User | None:
 
 
 async def is_owner(db: AsyncSession, tg_id: int) -> bool:
-    user = await get_user_by_tg(db, tg_id)
+    user = await user_cache.get(db, tg_id)
     return user is not None and user.role == "owner"
 
 
 async def has_access(db: AsyncSession, tg_id: int) -> bool:
-    user = await get_user_by_tg(db, tg_id)
+    user = await user_cache.get(db, tg_id)
     return user is not None and user.access_key is not None
 
 
@@ -62,6 +71,7 @@ async def activate_key(db: AsyncSession, key: str, tg_id: int,
         user.access_key = key
 
     await db.commit()
+    user_cache.invalidate(tg_id)
     return {"ok": True}
 
 
@@ -81,4 +91,116 @@ async def ensure_owner(db: AsyncSession, tg_id: int, username: str = "") -> tupl
                    used_by_tg=tg_id, used_at=datetime.utcnow())
     db.add(ak)
     await db.commit()
-    return user, key
\ No newline at end of file
+    return user, key
+
+
+# ── Telegram WebApp initData ──────────────────────────────────────────────────
+# https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+# Подпись проверяется один раз на строку initData: клиент шлёт одну и ту же
+# строку весь сеанс, дальше — поиск в словаре
+_identities: OrderedDict[str, tuple[int, int]] = OrderedDict()   # initData -> (tg_id, auth_date)
+_webapp_secret: bytes | None = None
+
+
+def _secret() -> bytes:
+    global _webapp_secret
+    if _webapp_secret is None:
+        _webapp_secret = hmac.new(b"WebAppData", settings.BOT_TOKEN.encode(),
+                                  hashlib.sha256).digest()
+    return _webapp_secret
+
+
+def _verify(init_data: str) -> tuple[int, int] | None:
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    sign = fields.pop("hash", "")
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    expected = hmac.new(_secret(), check.encode(), hashlib.sha256).hexdigest()
+    if not sign or not hmac.compare_digest(expected, sign):
+        return None
+    try:
+        return int(json.loads(fields["user"])["id"]), int(fields["auth_date"])
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def verify_init_data(init_data: str) -> int | None:
+    """tg_id из подписанной Telegram строки initData; None — подпись не сошлась или устарела."""
+    ident = _identities.get(init_data)
+    if ident is None:
+        ident = _verify(init_data)
+        if ident is None:
+            return None
+        _identities[init_data] = ident
+        if len(_identities) > settings.USER_CACHE_SIZE:
+            _identities.popitem(last=False)
+    else:
+        _identities.move_to_end(init_data)
+    tg_id, auth_date = ident
+    if settings.INIT_DATA_TTL and time.time() - auth_date > settings.INIT_DATA_TTL:
+        _identities.pop(init_data, None)
+        return None
+    return tg_id
+
+
+# ── Кэш юзеров ────────────────────────────────────────────────────────────────
+class CachedUser(NamedTuple):
+    """Снимок строки users для проверки доступа и курсов — без сессии БД."""
+    id:              int
+    tg_id:           int
+    username:        str | None
+    role:            str
+    access_key:      str | None
+    has_buff:        bool
+    buff_updated_at: datetime | None
+    usd_rub:         float
+    cny_usd:         float
+    notify_tg:       bool
+    notify_app:      bool
+    min_roi_notify:  float
+
+    @classmethod
+    def of(cls, u: User) -> "CachedUser":
+        return cls(u.id, u.tg_id, u.username, u.role, u.access_key,
+                   bool(u.buff_session), u.buff_updated_at, u.usd_rub, u.cny_usd,
+                   u.notify_tg, u.notify_app, u.min_roi_notify)
+
+
+class UserCache:
+    """
+    LRU на USER_CACHE_SIZE юзеров, запись живёт USER_CACHE_TTL секунд.
+    Кто меняет строку users в этом процессе — зовёт invalidate(tg_id);
+    TTL ограничивает устаревание, если строку поменял другой процесс
+    (бот при RUN_WORKERS_IN_API=False).
+    """
+
+    def __init__(self):
+        self._users: OrderedDict[int, tuple[CachedUser, float]] = OrderedDict()
+
+    def peek(self, tg_id: int) -> CachedUser | None:
+        entry = self._users.get(tg_id)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._users[tg_id]
+            return None
+        self._users.move_to_end(tg_id)
+        return entry[0]
+
+    async def get(self, db: AsyncSession, tg_id: int) -> CachedUser | None:
+        user = self.peek(tg_id)
+        if user is not None:
+            return user
+        row = await get_user_by_tg(db, tg_id)
+        if row is None:
+            return None   # отсутствие не кэшируем: юзер появится после /activate
+        user = CachedUser.of(row)
+        self._users[tg_id] = (user, time.monotonic() + settings.USER_CACHE_TTL)
+        if len(self._users) > settings.USER_CACHE_SIZE:
+            self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, tg_id: int):
+        self._users.pop(tg_id, None)
+
+
+user_cache = UserCache()
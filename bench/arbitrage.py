@@ -0,0 +1,86 @@
+"""
+Бенчмарк расчёта арбитража: поштучный цикл на Python против матрицы
+parsers.arbitrage (все пары площадок одним проходом NumPy).
+
+    python -m bench.arbitrage [N]
+"""
+import random
+import sys
+import time
+
+from parsers.arbitrage import FEES, PLATFORMS, best_from_buff, best_pair, compute, price_matrix
+
+
+def make_rows(n: int) -> list[dict[str, float | None]]:
+    rnd = random.Random(42)
+    rows = []
+    for _ in range(n):
+        buff = round(rnd.uniform(0.1, 500), 2)
+        rows.append({
+            "buff":     buff,
+            "cgm":      round(buff * rnd.uniform(0.8, 1.5), 2) if rnd.random() < 0.9 else None,
+            "skinport": round(buff * rnd.uniform(0.8, 1.5), 2) if rnd.random() < 0.7 else None,
+            "steam":    round(buff * rnd.uniform(1.0, 2.0), 2) if rnd.random() < 0.3 else None,
+        })
+    return rows
+
+
+def loop_from_buff(rows) -> list[tuple[str | None, float]]:
+    # Как было: calc_arbitrage на каждую позицию, продажа только против Buff
+    out = []
+    for row in rows:
+        buy = row["buff"]
+        best, best_roi = None, 0.0
+        for platform, sell in row.items():
+            if platform == "buff" or not sell:
+                continue
+            roi = round((sell * (1 - FEES[platform]) - buy) / buy * 100, 1)
+            if best is None or roi > best_roi:
+                best, best_roi = platform, roi
+        out.append((best, best_roi))
+    return out
+
+
+def loop_all_pairs(rows) -> list[float]:
+    out = []
+    for row in rows:
+        best = 0.0
+        for b in PLATFORMS:
+            for s in PLATFORMS:
+                buy, sell = row.get(b), row.get(s)
+                if b != s and buy and sell:
+                    best = max(best, round((sell * (1 - FEES[s]) - buy) / buy * 100, 1))
+        out.append(best)
+    return out
+
+
+def _time(fn, *args, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = fn(*args)
+        best = min(best, time.perf_counter() - t)
+    return best, res
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rows = make_rows(n)
+
+    t_loop, ref = _time(loop_from_buff, rows)
+    t_vec, got = _time(best_from_buff, rows)
+    assert [b for b, _ in got] == [b for b, _ in ref]
+    assert max(abs(a[1] - b[1]) for a, b in zip(got, ref)) <= 0.1 + 1e-9
+
+    t_loop_pairs, ref_pairs = _time(loop_all_pairs, rows)
+    t_vec_pairs, (_, _, pair_roi) = _time(lambda r: best_pair(compute(price_matrix(r))), rows)
+    assert max(abs(max(a, 0.0) - b) for a, b in zip(pair_roi, ref_pairs)) <= 0.1 + 1e-9
+
+    print(f"{n} позиций")
+    print(f"  покупка на Buff: цикл {t_loop * 1000:7.1f} мс | матрица {t_vec * 1000:7.1f} мс")
+    print(f"  все пары:        цикл {t_loop_pairs * 1000:7.1f} мс | "
+          f"матрица {t_vec_pairs * 1000:7.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
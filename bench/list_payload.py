@@ -0,0 +1,123 @@
+"""
+Бенчмарк сериализации списка арбитража, на 1000 позиций:
+dict на позицию + кодировщик FastAPI (как было) против склейки готовых
+фрагментов MarketItem.fragment.
+
+    python -m bench.list_payload [N]
+"""
+import json
+import random
+import sys
+import time
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from market_store import MarketItem, derive_all
+from parsers.arbitrage import SELL_LABELS
+
+
+def make_items(n: int) -> list[MarketItem]:
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    items = []
+    for i in range(n):
+        it = MarketItem(f"AK-47 | Redline (Field-Tested) #{i}")
+        buff = round(rnd.uniform(0.1, 500), 2)
+        it.update({
+            "icon_url": f"/api/img?p={'x' * 120}{i}", "buff_price": buff,
+            "cgm_price": round(buff * rnd.uniform(0.8, 1.5), 2),
+            "skinport_price": round(buff * rnd.uniform(0.8, 1.5), 2) if rnd.random() < 0.7 else None,
+            "steam_price": round(buff * rnd.uniform(1.0, 2.0), 2) if rnd.random() < 0.3 else None,
+            "buff_sell_num": rnd.randint(0, 200), "buff_buy_num": rnd.randint(0, 50),
+            "best_roi": round(rnd.uniform(-10, 40), 1), "best_sell_platform": "cgm",
+            "updated_at": now,
+            # Часть позиций со сработавшими правилами stability — причины в выдаче не пустые
+            "unstable_mask": (mask := rnd.choice((0, 0, 0, 1, 2, 6))), "is_unstable": bool(mask),
+            "unstable_confidence": round(rnd.uniform(0.6, 0.97), 3) if mask else 0.0,
+        })
+        it.first_24h = buff * rnd.uniform(0.8, 1.2)
+        items.append(it)
+    derive_all(items)
+    return items
+
+
+def legacy_view(it: MarketItem, cny_usd: float, usd_rub: float) -> dict:
+    # Как было: вложенный dict на позицию в каждом запросе
+    inv_cny = 1 / cny_usd if cny_usd else 0
+    platforms = {}
+    for pkey, (_, net_usd, profit, roi) in it.platforms.items():
+        platforms[pkey] = {
+            "label":      SELL_LABELS[pkey],
+            "sell_price": round(getattr(it, f"{pkey}_price"), 2),
+            "net_usd":    round(net_usd, 2),
+            "profit_usd": round(profit, 2),
+            "roi":        roi,
+            "net_cny":    round(net_usd * inv_cny, 0),
+            "net_rub":    round(net_usd * usd_rub, 0),
+            "profit_cny": round(profit * inv_cny, 0),
+            "profit_rub": round(profit * usd_rub, 0),
+        }
+    buff = it.buff_price or 0
+    return {
+        "name": it.name, "icon_url": it.icon_url, "buff_price": it.buff_price,
+        "buff_price_cny": round(buff * inv_cny, 0), "buff_price_rub": round(buff * usd_rub, 0),
+        "best_roi": it.best_roi, "best_sell": it.best_sell_platform,
+        "sell_num": it.buff_sell_num, "buy_num": it.buff_buy_num,
+        "liquidity": it.liquidity, "price_change_24h": it.price_change_24h,
+        "is_unstable": it.is_unstable,
+        "unstable_reason": it.unstable_reasons[0] if it.unstable_reasons else None,
+        "unstable_reasons": it.unstable_reasons,
+        "unstable_confidence": it.unstable_confidence or 0.0,
+        "platforms": platforms, "best_pair": it.best_pair,
+        "updated_at": it.updated_at.isoformat(),
+    }
+
+
+def _per_1000(fn, n: int, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best / n * 1000 * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    items = make_items(n)
+    rates = (0.138, 90.0)
+
+    # Подготовленные dict'ы легаси-пути, чтобы мерить только сериализацию
+    views = [legacy_view(it, *rates) for it in items]
+
+    def fastapi_default():
+        json.dumps(jsonable_encoder(views), ensure_ascii=False, allow_nan=False,
+                   separators=(",", ":")).encode()
+
+    def legacy_full():
+        vs = [legacy_view(it, *rates) for it in items]
+        json.dumps(jsonable_encoder(vs), ensure_ascii=False, allow_nan=False,
+                   separators=(",", ":")).encode()
+
+    def fragments_cold():
+        for it in items:
+            it._views.clear()
+        b"[" + b",".join(it.fragment(*rates) for it in items) + b"]"
+
+    def fragments_warm():
+        b"[" + b",".join(it.fragment(*rates) for it in items) + b"]"
+
+    body = b"[" + b",".join(it.fragment(*rates) for it in items) + b"]"
+    assert json.loads(body) == views
+
+    print(f"{n} позиций, мс на 1000:")
+    print(f"  как было: dict + jsonable_encoder + json  {_per_1000(legacy_full, n):7.2f}")
+    print(f"    из них сериализация готовых dict'ов     {_per_1000(fastapi_default, n):7.2f}")
+    print(f"  фрагменты, новая пара курсов              {_per_1000(fragments_cold, n):7.2f}")
+    print(f"  фрагменты, из кэша позиции                {_per_1000(fragments_warm, n):7.2f}")
+    print(f"  тик коллектора: derive + _head (orjson)   {_per_1000(lambda: derive_all(items), n):7.2f}")
+
+
+if __name__ == "__main__":
+    main()
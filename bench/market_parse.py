@@ -0,0 +1,116 @@
+"""
+Бенчмарк разбора дампа цен: resp.json() целиком против потокового stream_prices.
+
+    python -m bench.market_parse [N]
+
+Дамп генерируется один раз во временный файл, генерация и каждый режим
+гоняются в отдельных процессах: ru_maxrss наследуется от родителя при fork,
+так что родитель должен оставаться маленьким.
+"""
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from parsers.markets import stream_prices
+
+
+def make_payload(n: int) -> bytes:
+    """Синтетический дамп в формате CSGOMarket prices/USD.json."""
+    rnd = random.Random(42)
+    return json.dumps({
+        "success": True, "currency": "USD",
+        "items": [{
+            "market_hash_name": f"AK-47 | Redline (Field-Tested) #{i}",
+            "volume": str(rnd.randint(1, 500)),
+            "price": f"{rnd.random() * 100:.3f}",
+            "buy_order": round(rnd.random(), 3),
+            "avg_price": f"{rnd.random() * 100:.3f}",
+            "popularity_7d": str(rnd.randint(0, 50)),
+        } for i in range(n)],
+    }).encode()
+
+
+class _Stream:
+    """Имитация aiohttp StreamReader поверх bytes."""
+
+    def __init__(self, data: bytes):
+        self._buf = io.BytesIO(data)
+
+    async def read(self, n: int = -1) -> bytes:
+        await asyncio.sleep(0)
+        return self._buf.read(n)
+
+
+async def parse_full(data: bytes) -> dict[str, float]:
+    # Как было: resp.json() строит дерево всего ответа
+    body = await _Stream(data).read()
+    parsed = json.loads(body)
+    return {
+        i["market_hash_name"]: float(i["price"])
+        for i in parsed.get("items", [])
+        if i.get("market_hash_name") and i.get("price")
+    }
+
+
+async def parse_stream(data: bytes) -> dict[str, float]:
+    return await stream_prices(_Stream(data), "items.item", "price")
+
+
+def _run(mode: str, path: str):
+    with open(path, "rb") as f:
+        data = f.read()
+    parse = parse_full if mode == "full" else parse_stream
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    t = time.perf_counter()
+    prices = asyncio.run(parse(data))
+    took = time.perf_counter() - t
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    asyncio.run(parse(data))
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        "mode": mode, "items": len(prices), "seconds": round(took, 3),
+        "rss_growth_mb": round((rss_peak - rss_before) / 1024, 1),
+        "alloc_peak_mb": round(alloc_peak / 2 ** 20, 1),
+    }))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--mode":
+        _run(sys.argv[2], sys.argv[3])
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == "--gen":
+        with open(sys.argv[3], "wb") as f:
+            f.write(make_payload(int(sys.argv[2])))
+        return
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.NamedTemporaryFile(suffix=".json") as f:
+        subprocess.run([sys.executable, "-m", "bench.market_parse", "--gen", str(n), f.name],
+                       check=True)
+        size = os.path.getsize(f.name)
+        print(f"Дамп: {n} позиций, {size / 2 ** 20:.1f} МБ")
+        print(f"{'режим':<8}{'время, с':>10}{'рост RSS, МБ':>15}{'пик аллокаций, МБ':>20}")
+        for mode in ("full", "stream"):
+            out = subprocess.run(
+                [sys.executable, "-m", "bench.market_parse", "--mode", mode, f.name],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            r = json.loads(out)
+            print(f"{mode:<8}{r['seconds']:>10}{r['rss_growth_mb']:>15}{r['alloc_peak_mb']:>20}")
+
+
+if __name__ == "__main__":
+    main()
@@ -122,7 +122,7 @@ async def process_buff_cookie(msg: Message, state: FSMContext):
         return
 
     from database import AsyncSessionLocal
-    from auth import get_user_by_tg
+    from auth import get_user_by_tg, user_cache
     from datetime import datetime
     async with AsyncSessionLocal() as db:
         user = await get_user_by_tg(db, msg.from_user.id)
@@ -130,6 +130,7 @@ async def process_buff_cookie(msg: Message, state: FSMContext):
             user.buff_session = cookie
             user.buff_updated_at = datetime.utcnow()
             await db.commit()
+            user_cache.invalidate(msg.from_user.id)
 
     await state.clear()
     await msg.answer("✅ <b>Buff сессия обновлена!</b>\n\nДанные начнут появляться через ~5 минут.", parse_mode="HTML")
@@ -158,7 +159,7 @@ async def cmd_genkey(msg: Message):
 @dp.message(Command("rate"))
 async def cmd_rate(msg: Message):
     from database import AsyncSessionLocal
-    from auth import get_user_by_tg
+    from auth import get_user_by_tg, user_cache
     args = msg.text.split(maxsplit=1)
     if len(args) < 2:
         await msg.answer("Использование: <code>/rate 90.5</code>", parse_mode="HTML")
@@ -176,6 +177,7 @@ async def cmd_rate(msg: Message):
             return
         user.usd_rub = rate
         await db.commit()
+        user_cache.invalidate(msg.from_user.id)
 
     await msg.answer(f"✅ Курс USD/RUB установлен: <b>{rate}</b>", parse_mode="HTML")
 
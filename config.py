@@ -10,6 +10,67 @@ class Settings(BaseSettings):
     DEBUG: bool = False
     OWNER_TG_ID: int = 0
 
+    # True — воркеры и бот крутятся внутри API (всё в одном процессе).
+    # False — API только отвечает на запросы, воркеры запускаются отдельно:
+    # python -m workers
+    RUN_WORKERS_IN_API: bool = True
+
+    # ── Buff краулер ──────────────────────────────────────────────────────────
+    BUFF_FULL_CATALOG: bool = True      # False — старый режим: ножи, стр. 1–4
+    # category_group через запятую; "all" — общий вид каталога без категории
+    BUFF_CATEGORIES: str = ("knife,hands,rifle,pistol,smg,shotgun,machinegun,"
+                            "type_customplayer,sticker,other")
+    # Лимиты ниже — на одну куку: пул сессий масштабирует их числом живых кук
+    BUFF_PAGES_PER_TICK: int = 120      # бюджет страниц на тик коллектора
+    BUFF_CONCURRENCY: int = 4           # запросов в полёте одновременно
+    BUFF_RPS: float = 1.0               # запросов к Buff в секунду
+    # Доля бюджета на поштучное обновление «горячих» позиций (scheduler.py)
+    BUFF_HOT_SHARE: float = 0.3
+    BUFF_HOT_INTERVAL: int = 20         # период раунда поштучных обновлений, с
+
+    # ── Steam ─────────────────────────────────────────────────────────────────
+    STEAM_RPS: float = 0.2              # общий лимит запросов к Steam (0 — выключить)
+    STEAM_TTL: int = 21600              # базовый срок жизни цены, с (ROI ≥ 20% — /4)
+
+    # ── Дампы цен CSGOMarket / Skinport ───────────────────────────────────────
+    MARKET_CACHE_DIR: str = ".cache/markets"   # последний удачный дамп на диске
+
+    # ── История цен ───────────────────────────────────────────────────────────
+    HISTORY_EPSILON: float = 0.002      # пишем точку, если цена сдвинулась > 0.2%
+    HISTORY_HEARTBEAT: int = 3600       # ...или если точки не было столько секунд
+    # Postgres: price_history секционирована по месяцам (partitions.py)
+    HISTORY_PARTITIONS_AHEAD: int = 2   # партиций создаём наперёд, мес.
+    HISTORY_RETENTION_DAYS: int = 90    # сырые точки старше — DROP партиции (0 — хранить всё)
+
+    # ── Рынок в памяти (market_store.py) ──────────────────────────────────────
+    STORE_POLL: int = 3                 # как часто сверяем поколение данных в БД, с
+    STORE_RELOAD: int = 900             # полная перечитка из БД не реже, с (24ч окно)
+    LIST_PAGE_SIZE: int = 50            # позиций на странице /api/arbitrage/list по умолчанию
+    LIST_PAGE_MAX: int = 200            # ...и не больше, сколько бы ни попросили
+    LIST_CACHE_SIZE: int = 64           # готовых ответов /api/arbitrage/list на поколение
+    STREAM_BACKLOG: int = 32            # поколений в журнале изменений: докачка /stream без снапшота
+    STREAM_PING: int = 15               # комментарий-пинг в /stream при тишине, с
+
+    # ── Картинки /api/img (img_cache.py) ──────────────────────────────────────
+    IMG_CACHE_DIR: str = ".cache/img"   # иконки с CDN, файл на иконку
+    IMG_CACHE_MAX_MB: int = 512         # потолок кэша на диске, старые вытесняются (LRU)
+    IMG_MISS_TTL: int = 600             # иконки, которых нет на CDN, не перезапрашиваем, с
+    # Хедж (img_cdn.py): второй CDN спрашиваем, если первый молчит дольше своего p95,
+    # зажатого в [IMG_HEDGE_MIN, IMG_HEDGE_MAX]; без замеров — IMG_HEDGE_MAX
+    IMG_HEDGE_MIN: float = 0.05
+    IMG_HEDGE_MAX: float = 1.0
+    IMG_CDN_FAILS: int = 3              # ошибок подряд — CDN выключается...
+    IMG_CDN_COOLDOWN: int = 30          # ...на столько секунд, каждый повтор — вдвое дольше
+
+    # ── Авторизация (auth.py) ─────────────────────────────────────────────────
+    # True — запросы без подписи Telegram (X-Telegram-Init-Data) отклоняются (401).
+    # False — только на время выкатки клиента: без подписи верим tg_id из query,
+    # такие запросы считаются в /health (unsigned_requests) и пишутся в лог
+    WEBAPP_AUTH_REQUIRED: bool = True
+    INIT_DATA_TTL: int = 86400          # initData с auth_date старше — недействительна, с (0 — без срока)
+    USER_CACHE_SIZE: int = 10_000       # юзеров (и строк initData) в LRU-кэше процесса
+    USER_CACHE_TTL: int = 60            # запись кэша живёт, с: предел устаревания между процессами
+
     class Config:
         env_file = ".env"
 
@@ -1,9 +1,11 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Float, Integer, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import (String, Float, Integer, SmallInteger, Boolean, DateTime, ForeignKey,
+                        Text, Index, text)
 from datetime import datetime
 from typing import Optional
 from config import get_settings
+from partitions import ensure_partitioned, maintain_partitions
 
 settings = get_settings()
 engine = create_async_engine(
@@ -53,19 +55,51 @@ class AccessKey(Base):
     owner: Mapped["User"] = relationship(back_populates="keys")
 
 
+class Item(Base):
+    """Словарь позиций: market_hash_name ↔ id (см. items.py)."""
+    __tablename__ = "items"
+    id:   Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(200), unique=True)
+
+
 class PriceHistory(Base):
+    # На Postgres секционирована по recorded_at, PK (id, recorded_at) — см. partitions.py
     __tablename__ = "price_history"
     id:          Mapped[int]   = mapped_column(primary_key=True)
-    name:        Mapped[str]   = mapped_column(String(200), index=True)
-    platform:    Mapped[str]   = mapped_column(String(30))
+    item_id:     Mapped[int]   = mapped_column(Integer)          # items.id
+    platform:    Mapped[int]   = mapped_column(SmallInteger)     # items.PLATFORMS
     price_usd:   Mapped[float] = mapped_column(Float)
     recorded_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    __table_args__ = (Index("ix_price_history_item_ts", "item_id", "recorded_at"),)
+
+
+class _PriceRollup:
+    """Корзина свёртки истории цен: OHLC + сумма и число точек (для среднего)."""
+    item_id:   Mapped[int]      = mapped_column(Integer, primary_key=True)
+    platform:  Mapped[int]      = mapped_column(SmallInteger, primary_key=True)
+    bucket:    Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    open:      Mapped[float]    = mapped_column(Float)
+    high:      Mapped[float]    = mapped_column(Float)
+    low:       Mapped[float]    = mapped_column(Float)
+    close:     Mapped[float]    = mapped_column(Float)
+    sum_price: Mapped[float]    = mapped_column(Float)
+    count:     Mapped[int]      = mapped_column(Integer)
+
+
+class PriceRollup1h(_PriceRollup, Base):
+    __tablename__ = "price_rollup_1h"
+
+
+class PriceRollup1d(_PriceRollup, Base):
+    __tablename__ = "price_rollup_1d"
 
 
 class ArbitrageSnapshot(Base):
     __tablename__ = "arbitrage_snapshots"
     id:           Mapped[int]   = mapped_column(primary_key=True)
     name:         Mapped[str]   = mapped_column(String(200), unique=True, index=True)
+    item_id:      Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    buff_goods_id: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
     icon_url:     Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     buff_price:   Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     cgm_price:    Mapped[Optional[float]] = mapped_column(Float, nullable=True)
@@ -75,9 +109,35 @@ class ArbitrageSnapshot(Base):
     buff_buy_num:  Mapped[int]  = mapped_column(Integer, default=0)
     best_roi:     Mapped[float] = mapped_column(Float, default=0.0)
     best_sell_platform: Mapped[Optional[str]] = mapped_column(String(30), nullable=True)
+    # Классификатор стабильности (stability.py), считается коллектором
+    is_unstable:  Mapped[bool]  = mapped_column(Boolean, default=False, index=True)
+    unstable_mask: Mapped[int]  = mapped_column(Integer, default=0)      # биты stability.RULES
+    unstable_confidence: Mapped[float] = mapped_column(Float, default=0.0)
     updated_at:   Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+class ItemStats(Base):
+    """Скользящая статистика цены Buff по позиции, ведётся коллекторами (item_stats.py)."""
+    __tablename__ = "item_stats"
+    item_id:    Mapped[int]             = mapped_column(Integer, primary_key=True, autoincrement=False)
+    first_24h:  Mapped[Optional[float]] = mapped_column(Float)   # цена на начало 24ч окна
+    last_price: Mapped[Optional[float]] = mapped_column(Float)
+    min_24h:    Mapped[Optional[float]] = mapped_column(Float)
+    max_24h:    Mapped[Optional[float]] = mapped_column(Float)
+    min_7d:     Mapped[Optional[float]] = mapped_column(Float)
+    max_7d:     Mapped[Optional[float]] = mapped_column(Float)
+    count_24h:  Mapped[int]             = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime]        = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class MarketState(Base):
+    """Одна строка (id=1): поколение рыночных данных, растёт с каждой записью коллекторов."""
+    __tablename__ = "market_state"
+    id:         Mapped[int] = mapped_column(primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 class Alert(Base):
     __tablename__ = "alerts"
     id:          Mapped[int]  = mapped_column(primary_key=True)
@@ -132,6 +192,26 @@ async def get_db():
         yield session
 
 
+# create_all не трогает уже существующие таблицы — новые колонки докатываем тут.
+# Только идемпотентные команды: выполняются на каждом старте.
+MIGRATIONS = [
+    "ALTER TABLE arbitrage_snapshots ADD COLUMN IF NOT EXISTS buff_goods_id VARCHAR(20)",
+    "ALTER TABLE arbitrage_snapshots ADD COLUMN IF NOT EXISTS item_id INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_arbitrage_snapshots_item_id ON arbitrage_snapshots (item_id)",
+    "ALTER TABLE arbitrage_snapshots ADD COLUMN IF NOT EXISTS is_unstable BOOLEAN NOT NULL DEFAULT FALSE",
+    "ALTER TABLE arbitrage_snapshots ADD COLUMN IF NOT EXISTS unstable_mask INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE arbitrage_snapshots ADD COLUMN IF NOT EXISTS unstable_confidence DOUBLE PRECISION NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_arbitrage_snapshots_is_unstable ON arbitrage_snapshots (is_unstable)",
+]
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "postgresql":
+            for sql in MIGRATIONS:
+                await conn.execute(text(sql))
+            from items import migrate_to_ids
+            await migrate_to_ids(conn)
+            await ensure_partitioned(conn)
+            await maintain_partitions(conn)
@@ -0,0 +1,187 @@
+"""
+Дисковый кэш картинок для /api/img: файл на иконку, индекс в памяти,
+LRU с лимитом IMG_CACHE_MAX_MB.
+
+Рендер списка у многих юзеров разом — это тысячи запросов одних и тех же
+иконок: CDN спрашиваем один раз на хэш, параллельные запросы той же иконки
+ждут один и тот же fetch. Отсутствующие на CDN иконки помним IMG_MISS_TTL
+секунд, чтобы битые хэши не долбили CDN на каждом рендере.
+
+Файлы: IMG_CACHE_DIR/ab/abcdef….png (sha1 от p, тип — по расширению).
+Иконки — единицы килобайт: read() отдаёт содержимое байтами (из page
+cache), путь наружу не уходит и вытеснению не подвержен. Sendfile нет:
+FileResponse открыл бы путь уже после возврата из хендлера. Чтение и
+запись файлов — в asyncio.to_thread, цикл событий диск не ждёт.
+После рестарта индекс собирается обходом каталога, порядок LRU — по mtime.
+"""
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple
+
+from config import get_settings
+
+log = logging.getLogger("img_cache")
+settings = get_settings()
+
+# -> (содержимое, Content-Type); None — картинки нет (кэшируется как промах
+# на IMG_MISS_TTL); исключение — сбой, не кэшируется, уходит ждущим
+Fetch = Callable[[], Awaitable[tuple[bytes, str] | None]]
+
+
+class CachedImage(NamedTuple):
+    path:       str
+    size:       int
+    media_type: str
+
+
+def _key(p: str) -> str:
+    return hashlib.sha1(p.encode()).hexdigest()
+
+
+class ImageCache:
+    def __init__(self):
+        self.root = settings.IMG_CACHE_DIR
+        self.limit = settings.IMG_CACHE_MAX_MB * 1024 * 1024
+        self._index: OrderedDict[str, CachedImage] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._misses: dict[str, float] = {}   # ключ -> до какого времени не спрашиваем CDN
+        self._loaded = False
+
+    def load(self):
+        """Один раз за процесс собирает индекс по файлам на диске."""
+        if self._loaded:
+            return
+        self._loaded = True
+        found = []
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                if fn.endswith(".tmp"):
+                    _unlink(path)   # недописанный файл от упавшего процесса
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                key, ext = os.path.splitext(fn)
+                media_type = mimetypes.types_map.get(ext, "image/png")
+                found.append((st.st_mtime, key, CachedImage(path, st.st_size, media_type)))
+        for _, key, entry in sorted(found):
+            self._index[key] = entry
+            self._bytes += entry.size
+        self._evict()
+        if found:
+            log.info(f"{len(self._index)} картинок с диска, {self._bytes / 1048576:.1f} МБ")
+
+    async def get(self, p: str, fetch: Fetch) -> CachedImage | None:
+        """Файл иконки p; при промахе — fetch(), один на ключ на все запросы."""
+        self.load()
+        key = _key(p)
+        entry = self._index.get(key)
+        if entry is not None:
+            # Файла может уже не быть — это заметит read() и скачает заново
+            self._index.move_to_end(key)
+            return entry
+
+        miss = self._misses.get(key)
+        if miss is not None:
+            if miss > time.monotonic():
+                return None
+            del self._misses[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fill(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._settled(key, t))
+        # shield: клиент, закрывший соединение, не отменяет fetch остальным
+        return await asyncio.shield(task)
+
+    async def read(self, p: str, fetch: Fetch) -> tuple[bytes, str] | None:
+        """
+        (содержимое, Content-Type) иконки p. Файл читается сразу после get():
+        путь, отданный наружу, соседний _fill мог бы вытеснить раньше, чем
+        его откроют. Вытеснен между get() и чтением или удалён мимо кэша —
+        один повтор.
+        """
+        for _ in range(2):
+            img = await self.get(p, fetch)
+            if img is None:
+                return None
+            try:
+                return await asyncio.to_thread(_read_file, img.path), img.media_type
+            except FileNotFoundError:
+                if self._index.get(_key(p)) is img:
+                    self._drop(_key(p))
+        return None
+
+    async def _fill(self, key: str, fetch: Fetch) -> CachedImage | None:
+        got = await fetch()
+        if got is None:
+            self._misses[key] = time.monotonic() + settings.IMG_MISS_TTL
+            if len(self._misses) > 10_000:
+                now = time.monotonic()
+                self._misses = {k: t for k, t in self._misses.items() if t > now}
+            return None
+        content, media_type = got
+        media_type = media_type.split(";")[0].strip() or "image/png"
+        ext = mimetypes.guess_extension(media_type) or ".png"
+        path = os.path.join(self.root, key[:2], key + ext)
+        try:
+            await asyncio.to_thread(_write_file, path, content)
+        except OSError as e:
+            log.warning(f"не удалось сохранить {key}: {e}")
+            return None
+        entry = CachedImage(path, len(content), mimetypes.types_map.get(ext, media_type))
+        self._drop(key)
+        self._index[key] = entry
+        self._bytes += entry.size
+        self._evict()
+        return entry
+
+    def _settled(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()   # ждущие могли уйти: без "exception was never retrieved"
+
+    def _drop(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        # Последняя запись не вытесняется: её прямо сейчас отдаём
+        while self._bytes > self.limit and len(self._index) > 1:
+            _, entry = self._index.popitem(last=False)
+            self._bytes -= entry.size
+            _unlink(entry.path)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, content: bytes):
+    # Один fill на ключ (_inflight) — .tmp одного пути пишет один поток
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+img_cache = ImageCache()
@@ -0,0 +1,180 @@
+"""
+Выбор Steam CDN для /api/img по здоровью, с хеджированием.
+
+По каждому CDN копим задержки ответов (EWMA для ранга, окно для p95) и
+подряд идущие ошибки. После IMG_CDN_FAILS ошибок подряд CDN выключается
+на IMG_CDN_COOLDOWN секунд (каждое повторное срабатывание — вдвое дольше,
+до 10 минут), потом снова получает запросы: удача закрывает выключатель.
+
+Оценка старше IMG_CDN_COOLDOWN не в счёт: такой CDN получает пробный
+запрос первым, иначе отставший однажды CDN не вернулся бы никогда.
+
+Запрос идёт в самый быстрый здоровый CDN; если тот молчит дольше своего
+p95 — параллельно в следующий, ошибка — сразу в следующий. Побеждает
+первая картинка, остальные запросы отменяются. Хвост задержки ограничен
+p95 лучшего CDN, а не таймаутом худшего.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from config import get_settings
+
+log = logging.getLogger("img_cdn")
+settings = get_settings()
+
+WINDOW = 64            # последних задержек на CDN для p95
+EWMA = 0.2             # вес нового замера в средней
+MAX_COOLDOWN = 600     # потолок выключения CDN, с
+
+# (статус, содержимое, Content-Type); исключение — CDN не ответил
+Request = Callable[[str], Awaitable[tuple[int, bytes, str]]]
+
+
+class CdnUnavailable(Exception):
+    """Картинку никто не отдал, и не все CDN ответили 404: сбой, а не отсутствие."""
+
+
+class CdnHealth:
+    def __init__(self, base: str):
+        self.base = base
+        self.latency: float | None = None   # EWMA, с
+        self.samples: deque[float] = deque(maxlen=WINDOW)
+        self.fails = 0                       # ошибок подряд
+        self.trips = 0                       # срабатываний выключателя подряд
+        self.open_until = 0.0
+        self.seen = 0.0                      # когда был последний замер
+
+    @property
+    def stale(self) -> bool:
+        """Замеров давно не было (CDN в конце очереди) — оценке не верим."""
+        return self.latency is None or time.monotonic() - self.seen > settings.IMG_CDN_COOLDOWN
+
+    def _measure(self, elapsed: float):
+        self.latency = elapsed if self.stale else self.latency + EWMA * (elapsed - self.latency)
+        self.seen = time.monotonic()
+
+    def ok(self, elapsed: float):
+        self.samples.append(elapsed)
+        self._measure(elapsed)
+        if self.trips:
+            log.info(f"{self.base}: снова в строю")
+        self.fails = self.trips = 0
+        self.open_until = 0.0
+
+    def slow(self, elapsed: float):
+        """Ответа не дождались (проиграл хедж): задержка не меньше elapsed."""
+        if self.stale or elapsed > self.latency:
+            self._measure(elapsed)
+
+    def fail(self, elapsed: float):
+        # Ошибка стоит юзеру не меньше хеджа: быстро падающий CDN не должен
+        # выглядеть быстрым
+        self.slow(max(elapsed, settings.IMG_HEDGE_MAX))
+        self.fails += 1
+        if self.fails >= settings.IMG_CDN_FAILS:
+            cooldown = min(settings.IMG_CDN_COOLDOWN * 2 ** self.trips, MAX_COOLDOWN)
+            self.open_until = time.monotonic() + cooldown
+            self.trips += 1
+            self.fails = 0
+            log.warning(f"{self.base}: выключен на {cooldown}с")
+
+    @property
+    def available(self) -> bool:
+        return self.open_until <= time.monotonic()
+
+    def p95(self) -> float | None:
+        if len(self.samples) < 8:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    def hedge_delay(self) -> float:
+        p95 = self.p95()
+        if p95 is None:
+            return settings.IMG_HEDGE_MAX
+        return min(max(p95, settings.IMG_HEDGE_MIN), settings.IMG_HEDGE_MAX)
+
+    def snapshot(self) -> dict:
+        return {
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "p95_ms":     round(self.p95() * 1000) if self.p95() is not None else None,
+            "available":  self.available,
+        }
+
+
+class CdnPool:
+    def __init__(self, bases: list[str]):
+        self.cdns = [CdnHealth(b) for b in bases]
+
+    def ranked(self) -> list[CdnHealth]:
+        """
+        Здоровые по возрастанию задержки (без свежих замеров — в исходном
+        порядке, перед остальными: так CDN из конца очереди раз в
+        IMG_CDN_COOLDOWN получает запрос и может вернуться), затем
+        выключенные — на случай, если лежат все.
+        """
+        up = [c for c in self.cdns if c.available]
+        down = [c for c in self.cdns if not c.available]
+        up.sort(key=lambda c: -1.0 if c.stale else c.latency)
+        down.sort(key=lambda c: c.open_until)
+        return up + down
+
+    async def fetch(self, request: Request, path: str) -> tuple[bytes, str] | None:
+        """
+        Первая картинка по path с хеджированием по ranked(). None — картинки
+        нет: был 404 и ни одного сбоя. Иначе — CdnUnavailable.
+        """
+        queue = self.ranked()
+        missing = failed = 0
+        running: dict[asyncio.Task, CdnHealth] = {}
+        started: dict[asyncio.Task, float] = {}
+
+        def launch():
+            cdn = queue.pop(0)
+            task = asyncio.create_task(request(f"{cdn.base}/{path}"))
+            running[task] = cdn
+            started[task] = time.monotonic()
+            return cdn
+
+        try:
+            primary = launch()
+            while running:
+                timeout = primary.hedge_delay() if queue else None
+                done, _ = await asyncio.wait(running, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    primary = launch()   # хедж: текущий молчит дольше своего p95
+                    continue
+                for task in done:
+                    cdn = running.pop(task)
+                    elapsed = time.monotonic() - started.pop(task)
+                    try:
+                        status, content, ctype = task.result()
+                    except Exception:
+                        status = None
+                    if status == 200:
+                        cdn.ok(elapsed)
+                        return content, ctype
+                    # 404 — CDN жив, картинки нет; сеть, 5xx, 429 — CDN болеет
+                    if status is not None and status < 500 and status != 429:
+                        cdn.ok(elapsed)
+                        missing += status == 404
+                    else:
+                        cdn.fail(elapsed)
+                        failed += 1
+                    if queue:
+                        primary = launch()   # не ответил — следующий без ожидания
+            if missing and not failed:
+                return None
+            raise CdnUnavailable(path)
+        finally:
+            now = time.monotonic()
+            for task, cdn in running.items():
+                task.cancel()
+                cdn.slow(now - started[task])
+
+    def snapshot(self) -> dict:
+        return {c.base: c.snapshot() for c in self.cdns}
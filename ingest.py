@@ -0,0 +1,189 @@
+"""
+Пакетная запись результатов коллектора в БД.
+
+Снапшоты пишутся одним INSERT ... ON CONFLICT (name) DO UPDATE на чанк,
+неизменившиеся строки не отправляются вовсе и не перезаписываются в БД.
+История цен на Postgres льётся бинарным COPY, на остальных БД — executemany,
+причём в неё попадают только изменения цены и редкие heartbeat-точки.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import ArbitrageSnapshot, PriceHistory, MarketState
+from items import directory, PLATFORMS
+
+log = logging.getLogger("ingest")
+
+UPSERT_CHUNK = 1000  # 1000 строк × 15 колонок — с запасом ниже лимита параметров asyncpg
+
+# Поля, изменение которых считается изменением снапшота (updated_at — нет)
+SNAPSHOT_FIELDS = (
+    "item_id", "buff_goods_id", "icon_url", "buff_price", "cgm_price", "skinport_price",
+    "buff_sell_num", "buff_buy_num", "best_roi", "best_sell_platform",
+    "is_unstable", "unstable_mask", "unstable_confidence",
+)
+
+# Что пишет обновление цен Steam (update_steam_prices)
+STEAM_FIELDS = ("steam_price", "best_roi", "best_sell_platform",
+                "is_unstable", "unstable_mask", "unstable_confidence")
+
+# Колонки price_history в порядке закодированных записей (encode_history)
+HISTORY_COLUMNS = ("item_id", "platform", "price_usd", "recorded_at")
+
+# name -> кортеж SNAPSHOT_FIELDS, последнее записанное состояние
+_written: dict[str, tuple] = {}
+
+# (name, platform) -> (price, ts): последняя записанная точка истории
+_hist_written: dict[tuple, tuple] = {}
+# (name, platform) -> (price, ts): последнее наблюдение, не попавшее в историю
+_hist_pending: dict[tuple, tuple] = {}
+
+
+def _insert_for(db: AsyncSession):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта."""
+    return sqlite_insert if db.bind.dialect.name == "sqlite" else pg_insert
+
+
+def _fingerprint(row: dict) -> tuple:
+    return tuple(row.get(f) for f in SNAPSHOT_FIELDS)
+
+
+async def upsert_snapshots(db: AsyncSession, rows: list[dict]) -> int:
+    """
+    rows — dict'ы с name + SNAPSHOT_FIELDS (кроме item_id, его проставим) + updated_at.
+    Возвращает число отправленных в БД строк. Коммит — на стороне вызывающего.
+    """
+    # Последняя запись по имени побеждает: дубли в одном чанке ON CONFLICT не переживёт
+    latest = {r["name"]: r for r in rows}
+    ids = await directory.intern(db, latest)
+    latest = {name: {**r, "item_id": ids[name]} for name, r in latest.items()}
+    changed = [r for name, r in latest.items() if _written.get(name) != _fingerprint(r)]
+    if not changed:
+        return 0
+
+    insert = _insert_for(db)
+    table = ArbitrageSnapshot.__table__
+    for i in range(0, len(changed), UPSERT_CHUNK):
+        chunk = changed[i:i + UPSERT_CHUNK]
+        stmt = insert(table).values(chunk)
+        ex = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={f: ex[f] for f in (*SNAPSHOT_FIELDS, "updated_at")},
+            # Страховка после рестарта, когда _written пуст: одинаковые строки не трогаем
+            where=tuple_(*(table.c[f] for f in SNAPSHOT_FIELDS))
+                  .is_distinct_from(tuple_(*(ex[f] for f in SNAPSHOT_FIELDS))),
+        )
+        await db.execute(stmt)
+
+    for r in changed:
+        _written[r["name"]] = _fingerprint(r)
+    return len(changed)
+
+
+def forget_written():
+    """Сбрасывает кэш записанного состояния (после отката транзакции)."""
+    _written.clear()
+    _hist_written.clear()
+    _hist_pending.clear()
+
+
+def select_history(records: list[tuple], epsilon: float, heartbeat: float) -> list[tuple]:
+    """
+    Оставляет из наблюдений тика только точки, которые стоит записать:
+    цена ушла больше чем на epsilon (доля) от последней записанной или
+    с последней записи прошло heartbeat секунд.
+
+    Перед точкой изменения дописывается последнее незаписанное наблюдение
+    старой цены — так ломаная по сохранённым точкам совпадает с исходной
+    кривой (в пределах epsilon), а между точками цена считается постоянной.
+    """
+    out: list[tuple] = []
+    for rec in records:
+        name, platform, price, ts = rec
+        key = (name, platform)
+        prev = _hist_written.get(key)
+        if prev is not None:
+            prev_price, prev_ts = prev
+            moved = abs(price - prev_price) > epsilon * max(prev_price, 1e-9)
+            if not moved and (ts - prev_ts).total_seconds() < heartbeat:
+                _hist_pending[key] = (price, ts)
+                continue
+            pending = _hist_pending.pop(key, None)
+            if moved and pending is not None:
+                out.append((name, platform, *pending))
+        out.append(rec)
+        _hist_written[key] = (price, ts)
+    return out
+
+
+async def encode_history(db: AsyncSession, records: list[tuple]) -> list[tuple]:
+    """(name, platform, price, ts) → (item_id, код площадки, price, ts) в порядке HISTORY_COLUMNS."""
+    ids = await directory.intern(db, {r[0] for r in records})
+    return [(ids[name], PLATFORMS[platform], price, ts) for name, platform, price, ts in records]
+
+
+async def insert_history(db: AsyncSession, records: list[tuple]) -> int:
+    """
+    Пишет точки истории цен. records — кортежи (name, platform, price, ts).
+    Подходит и для коллектора, и для бэкфиллов. Коммит — на стороне вызывающего.
+    """
+    if not records:
+        return 0
+    records = await encode_history(db, records)
+
+    if db.bind.dialect.name == "postgresql" and db.bind.dialect.driver == "asyncpg":
+        # COPY идёт по соединению сессии — в той же транзакции, что и снапшоты
+        conn = await db.connection()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            PriceHistory.__tablename__, records=records, columns=HISTORY_COLUMNS,
+        )
+    else:
+        await db.execute(
+            PriceHistory.__table__.insert(),
+            [dict(zip(HISTORY_COLUMNS, r)) for r in records],
+        )
+    return len(records)
+
+
+async def update_steam_prices(db: AsyncSession, rows: list[dict]) -> int:
+    """
+    rows — dict'ы name, steam_price, best_roi, best_sell_platform + поля стабильности.
+    Одна executemany-команда UPDATE на всю пачку. Коммит — на стороне вызывающего.
+    """
+    if not rows:
+        return 0
+    table = ArbitrageSnapshot.__table__
+    stmt = (
+        table.update()
+        .where(table.c.name == bindparam("b_name"))
+        .values({f: bindparam(f) for f in STEAM_FIELDS})
+    )
+    await db.execute(stmt, [{"b_name": r["name"], **{f: r[f] for f in STEAM_FIELDS}}
+                            for r in rows])
+    return len(rows)
+
+
+async def bump_generation(db: AsyncSession) -> int:
+    """
+    Увеличивает market_state.generation в транзакции вызывающего и возвращает
+    новое значение: процессы, которые держат рынок в памяти, видят по нему,
+    что пора перечитать БД.
+    """
+    table = MarketState.__table__
+    await db.execute(
+        _insert_for(db)(table).values(id=1, generation=0, updated_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[table.c.id])
+    )
+    res = await db.execute(
+        table.update().where(table.c.id == 1)
+        .values(generation=table.c.generation + 1, updated_at=datetime.utcnow())
+        .returning(table.c.generation)
+    )
+    return res.scalar_one()
@@ -0,0 +1,165 @@
+"""
+Скользящая статистика цены Buff по каждой позиции: за 24ч — цена на
+начало окна, последняя, min/max и число точек; за 7д — min/max.
+
+Окна выровнены по часам (24 часовые корзины, включая текущую) и по дням
+(7 суточных). В памяти коллектора на позицию держится кольцо из не более
+HOUR_SLOTS часовых и DAY_SLOTS суточных корзин, поэтому обновление и
+пересчёт — O(1) на позицию за тик, сколько бы точек ни было в истории.
+Кормится теми же точками, что и свёртки (rollups.py), и после рестарта
+восстанавливается из них же. Результат — строка item_stats на позицию.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import ItemStats, PriceRollup1h, PriceRollup1d
+from ingest import _insert_for
+from items import directory, PLATFORMS
+from rollups import bucket_start
+
+log = logging.getLogger("item_stats")
+
+HOUR = timedelta(hours=1)
+DAY  = timedelta(days=1)
+HOUR_SLOTS = 26   # 24ч окно + корзина до него (цена на начало окна) + запас
+DAY_SLOTS  = 8
+UPSERT_CHUNK = 1000
+
+STAT_FIELDS = ("first_24h", "last_price", "min_24h", "max_24h",
+               "min_7d", "max_7d", "count_24h")
+
+
+class _Ring:
+    """Часовые [bucket, open, low, high, close, count] и суточные [bucket, low, high] корзины."""
+    __slots__ = ("hours", "days")
+
+    def __init__(self):
+        self.hours: list[list] = []
+        self.days: list[list] = []
+
+    def add(self, price: float, ts: datetime):
+        h = bucket_start(ts, HOUR)
+        if self.hours and self.hours[-1][0] == h:
+            slot = self.hours[-1]
+            slot[2] = min(slot[2], price); slot[3] = max(slot[3], price)
+            slot[4] = price; slot[5] += 1
+        elif not self.hours or self.hours[-1][0] < h:
+            self.hours.append([h, price, price, price, price, 1])
+            if len(self.hours) > HOUR_SLOTS:
+                del self.hours[0]
+        d = bucket_start(ts, DAY)
+        if self.days and self.days[-1][0] == d:
+            slot = self.days[-1]
+            slot[1] = min(slot[1], price); slot[2] = max(slot[2], price)
+        elif not self.days or self.days[-1][0] < d:
+            self.days.append([d, price, price])
+            if len(self.days) > DAY_SLOTS:
+                del self.days[0]
+
+    def stats(self, now: datetime) -> dict | None:
+        start_24h = bucket_start(now, HOUR) - 23 * HOUR
+        start_7d  = bucket_start(now, DAY) - 6 * DAY
+        window = [s for s in self.hours if s[0] >= start_24h]
+        if not window:
+            return None
+        before = [s for s in self.hours if s[0] < start_24h]
+        # Цена на начало окна: последняя до него (история — ступеньки), иначе первая внутри
+        first = before[-1][4] if before else window[0][1]
+        days = [s for s in self.days if s[0] >= start_7d]
+        return {
+            "first_24h":  first,
+            "last_price": window[-1][4],
+            "min_24h":    min(first, min(s[2] for s in window)),
+            "max_24h":    max(first, max(s[3] for s in window)),
+            "min_7d":     min(s[1] for s in days) if days else None,
+            "max_7d":     max(s[2] for s in days) if days else None,
+            "count_24h":  sum(s[5] for s in window),
+        }
+
+
+class RollingStats:
+    def __init__(self):
+        self.rings: dict[int, _Ring] = {}
+        self.seeded = False
+
+    async def seed(self, db: AsyncSession):
+        """Восстанавливает кольца из свёрток (после рестарта процесса)."""
+        now = datetime.utcnow()
+        buff = PLATFORMS["buff"]
+        rings: dict[int, _Ring] = {}
+        res = await db.execute(
+            select(PriceRollup1h.item_id, PriceRollup1h.bucket, PriceRollup1h.open,
+                   PriceRollup1h.low, PriceRollup1h.high, PriceRollup1h.close,
+                   PriceRollup1h.count)
+            .where(PriceRollup1h.platform == buff,
+                   PriceRollup1h.bucket >= bucket_start(now, HOUR) - (HOUR_SLOTS - 1) * HOUR)
+            .order_by(PriceRollup1h.bucket)
+        )
+        for item_id, *slot in res.all():
+            rings.setdefault(item_id, _Ring()).hours.append(list(slot))
+        res = await db.execute(
+            select(PriceRollup1d.item_id, PriceRollup1d.bucket,
+                   PriceRollup1d.low, PriceRollup1d.high)
+            .where(PriceRollup1d.platform == buff,
+                   PriceRollup1d.bucket >= bucket_start(now, DAY) - (DAY_SLOTS - 1) * DAY)
+            .order_by(PriceRollup1d.bucket)
+        )
+        for item_id, *slot in res.all():
+            rings.setdefault(item_id, _Ring()).days.append(list(slot))
+        self.rings = rings
+        self.seeded = True
+        log.info(f"📈 Статистика позиций: {len(rings)} колец из свёрток")
+
+    def invalidate(self):
+        """Транзакция откатилась — кольца впереди БД, пересобрать из свёрток."""
+        self.rings = {}
+        self.seeded = False
+
+    def observe(self, item_id: int, price: float, ts: datetime):
+        ring = self.rings.get(item_id)
+        if ring is None:
+            ring = self.rings[item_id] = _Ring()
+        ring.add(price, ts)
+
+
+rolling = RollingStats()
+
+
+async def update_item_stats(db: AsyncSession, records: list[tuple]) -> dict[str, dict]:
+    """
+    Вливает точки истории (name, platform, price, ts) в кольца и пишет
+    item_stats затронутых позиций Buff. Возвращает {name: статистика}.
+    Вызывать до upsert_rollups: засев колец читает свёртки и не должен
+    увидеть эти же точки. Коммит — на стороне вызывающего.
+    """
+    if not rolling.seeded:
+        await rolling.seed(db)
+    buff = [r for r in records if r[1] == "buff"]
+    if not buff:
+        return {}
+    ids = await directory.intern(db, {r[0] for r in buff})
+    now = max(r[3] for r in buff)
+    for name, _, price, ts in sorted(buff, key=lambda r: r[3]):
+        rolling.observe(ids[name], price, ts)
+
+    out: dict[str, dict] = {}
+    rows: list[dict] = []
+    for name in {r[0] for r in buff}:
+        st = rolling.rings[ids[name]].stats(now)
+        if st is None:
+            continue
+        out[name] = st
+        rows.append({"item_id": ids[name], **st, "updated_at": now})
+    if rows:
+        table = ItemStats.__table__
+        stmt = _insert_for(db)(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.item_id],
+            set_={f: stmt.excluded[f] for f in (*STAT_FIELDS, "updated_at")},
+        )
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            await db.execute(stmt, rows[i:i + UPSERT_CHUNK])
+    return out
@@ -0,0 +1,144 @@
+"""
+Словарь позиций и площадок.
+
+В price_history, свёртках и снапшотах позиция хранится целым items.id,
+площадка — кодом из PLATFORMS (SMALLINT), а не строками по 200 и 30
+символов в каждой строке. Наружу (API, бот) по-прежнему отдаются имена:
+directory держит в памяти процесса обе стороны соответствия и заводит
+новые имена в items по мере появления.
+"""
+import logging
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from database import Item
+from partitions import LOCK_ID
+
+log = logging.getLogger("items")
+
+# Коды площадок в БД. Только дописывать: коды уже лежат в истории
+PLATFORMS = {"buff": 1, "cgm": 2, "skinport": 3, "steam": 4, "csfloat": 5}
+PLATFORM_NAMES = {code: name for name, code in PLATFORMS.items()}
+
+INTERN_CHUNK = 1000
+
+
+class ItemDirectory:
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.names: dict[int, str] = {}
+
+    def _remember(self, rows):
+        for item_id, name in rows:
+            self.ids[name] = item_id
+            self.names[item_id] = name
+
+    async def intern(self, db: AsyncSession, names) -> dict[str, int]:
+        """
+        Гарантирует id для всех names и возвращает кэш name -> id. Новые имена
+        вставляются отдельной короткой транзакцией: словарь только растёт,
+        и откат транзакции вызывающего не должен оставлять в кэше id,
+        которых нет в БД.
+        """
+        missing = sorted({n for n in names if n not in self.ids})
+        if not missing:
+            return self.ids
+        insert = sqlite_insert if db.bind.dialect.name == "sqlite" else pg_insert
+        table = Item.__table__
+        stmt = insert(table).on_conflict_do_nothing(index_elements=[table.c.name])
+        async with db.bind.begin() as conn:
+            for i in range(0, len(missing), INTERN_CHUNK):
+                chunk = missing[i:i + INTERN_CHUNK]
+                await conn.execute(stmt, [{"name": n} for n in chunk])
+                res = await conn.execute(
+                    select(table.c.id, table.c.name).where(table.c.name.in_(chunk))
+                )
+                self._remember(res.all())
+        return self.ids
+
+    async def id_of(self, db: AsyncSession, name: str) -> int | None:
+        """id существующей позиции без заведения новой."""
+        item_id = self.ids.get(name)
+        if item_id is None:
+            res = await db.execute(select(Item.id).where(Item.name == name))
+            item_id = res.scalar_one_or_none()
+            if item_id is not None:
+                self._remember([(item_id, name)])
+        return item_id
+
+    async def names_of(self, db: AsyncSession, ids) -> dict[int, str]:
+        """Имена по id; недостающие в кэше дочитываются одним запросом."""
+        missing = [i for i in set(ids) if i not in self.names]
+        if missing:
+            res = await db.execute(select(Item.id, Item.name).where(Item.id.in_(missing)))
+            self._remember(res.all())
+        return self.names
+
+
+directory = ItemDirectory()
+
+
+# ── Миграция со строковых колонок ─────────────────────────────────────────────
+# (таблица, колонки PK после перехода на id или None)
+_NAME_TABLES = (
+    ("price_history", None),
+    ("price_rollup_1h", ("item_id", "platform", "bucket")),
+    ("price_rollup_1d", ("item_id", "platform", "bucket")),
+)
+
+
+async def _has_column(conn: AsyncConnection, table: str, column: str) -> bool:
+    res = await conn.execute(text(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = :t AND column_name = :c"
+    ), {"t": table, "c": column})
+    return res.first() is not None
+
+
+async def migrate_to_ids(conn: AsyncConnection):
+    """
+    Postgres: переводит price_history и свёртки с name/platform-строк на
+    item_id/код площадки, заполняет items и arbitrage_snapshots.item_id.
+    Идемпотентно; переписывание истории — один раз, при первом старте.
+    """
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID})
+    await conn.execute(text(
+        "INSERT INTO items (name) SELECT name FROM arbitrage_snapshots "
+        "ON CONFLICT (name) DO NOTHING"
+    ))
+    platform_case = "CASE platform " + " ".join(
+        f"WHEN '{name}' THEN {code}" for name, code in PLATFORMS.items()
+    ) + " END"
+
+    for table, pk in _NAME_TABLES:
+        if not await _has_column(conn, table, "name"):
+            continue
+        log.info(f"🔢 {table}: переход на item_id / код площадки…")
+        for sql in (
+            f"INSERT INTO items (name) SELECT DISTINCT name FROM {table} "
+            f"ON CONFLICT (name) DO NOTHING",
+            f"ALTER TABLE {table} ADD COLUMN item_id INTEGER, ADD COLUMN platform_code SMALLINT",
+            f"UPDATE {table} t SET item_id = i.id, platform_code = {platform_case} "
+            f"FROM items i WHERE i.name = t.name",
+            # Строки с площадкой не из PLATFORMS перенести некуда
+            f"DELETE FROM {table} WHERE platform_code IS NULL",
+            f"ALTER TABLE {table} DROP COLUMN name, DROP COLUMN platform",
+            f"ALTER TABLE {table} RENAME COLUMN platform_code TO platform",
+            f"ALTER TABLE {table} ALTER COLUMN item_id SET NOT NULL, "
+            f"ALTER COLUMN platform SET NOT NULL",
+        ):
+            await conn.execute(text(sql))
+        if pk:
+            # Старый PK ушёл вместе с колонкой name
+            await conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY ({', '.join(pk)})"))
+        else:
+            await conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_item_ts ON {table} (item_id, recorded_at)"
+            ))
+
+    await conn.execute(text(
+        "UPDATE arbitrage_snapshots s SET item_id = i.id FROM items i "
+        "WHERE s.item_id IS NULL AND i.name = s.name"
+    ))
@@ -6,10 +6,16 @@ import logging
 import os
 import aiohttp
 
+from config import get_settings
 from database import init_db, AsyncSessionLocal
-from routers.routes import users, arbitrage, charts, alerts, portfolio, trades
+from routers import routes
+from routers.routes import users, arbitrage, stream, charts, alerts, portfolio, trades
 from workers import start_workers
 from bot.bot import start_bot
+from parsers.markets import market_cache_age
+from market_store import market_store
+from img_cache import img_cache
+from img_cdn import CdnPool, CdnUnavailable
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,13 +23,14 @@ logging.basicConfig(
 )
 log = logging.getLogger("skintel")
 
-# Steam CDN варианты (пробуем по порядку)
+# Steam CDN варианты: порядок — только до первых замеров, дальше по здоровью (img_cdn.py)
 STEAM_CDNS = [
     "https://steamcommunity-a.akamaihd.net/economy/image",
     "https://community.cloudflare.steamstatic.com/economy/image",
     "https://cdn.steam.tools/images/economy/image",
 ]
 
+cdn_pool = CdnPool(STEAM_CDNS)
 _img_session: aiohttp.ClientSession | None = None
 
 async def get_img_session():
@@ -48,9 +55,19 @@ async def lifespan(app: FastAPI):
             else:
                 log.info("👑 Owner уже существует")
 
-    asyncio.create_task(start_workers())
-    asyncio.create_task(start_bot())
-    log.info("✅ Воркеры и бот запущены")
+    try:
+        await market_store.ensure_loaded()
+    except Exception as e:
+        log.warning(f"Рынок не загружен, догрузим по первому запросу: {e}")
+    asyncio.create_task(market_store.follow())
+    img_cache.load()
+
+    if get_settings().RUN_WORKERS_IN_API:
+        asyncio.create_task(start_workers())
+        asyncio.create_task(start_bot())
+        log.info("✅ Воркеры и бот запущены")
+    else:
+        log.info("✅ Режим API: воркеры и бот работают отдельным процессом")
     yield
     if _img_session and not _img_session.closed:
         await _img_session.close()
@@ -65,10 +82,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 app.include_router(users,     prefix="/api/users",     tags=["users"])
 app.include_router(arbitrage, prefix="/api/arbitrage", tags=["arbitrage"])
+app.include_router(stream,    prefix="/api/arbitrage", tags=["arbitrage"])
 app.include_router(charts,    prefix="/api/charts",    tags=["charts"])
 app.include_router(alerts,    prefix="/api/alerts",    tags=["alerts"])
 app.include_router(portfolio, prefix="/api/portfolio", tags=["portfolio"])
@@ -77,7 +96,9 @@ app.include_router(trades,    prefix="/api/trades",    tags=["trades"])
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "market_cache_age": market_cache_age(),
+            "img_cdns": cdn_pool.snapshot(),
+            "unsigned_requests": routes.unsigned_requests}
 
 
 @app.get("/api/img")
@@ -88,23 +109,34 @@ async def proxy_image(p: str):
     # Убираем слэши по краям
     p = p.strip("/")
 
+    try:
+        img = await img_cache.read(p, lambda: fetch_image(p))
+    except CdnUnavailable:
+        return Response(status_code=502)   # сбой CDN: без кэша, следующий запрос спросит снова
+    if img is None:
+        return Response(status_code=404)
+    content, media_type = img
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "Cache-Control": "public, max-age=86400",
+            "Access-Control-Allow-Origin": "*",
+        },
+    )
+
+
+async def fetch_image(p: str) -> tuple[bytes, str] | None:
+    """
+    Иконка с самого здорового CDN, с хеджем на следующий: (содержимое,
+    Content-Type); None — на CDN её нет; CdnUnavailable — CDN не ответили.
+    """
+    return await cdn_pool.fetch(_cdn_get, f"{p}/96fx96f")
+
+
+async def _cdn_get(url: str) -> tuple[int, bytes, str]:
     session = await get_img_session()
-    for cdn in STEAM_CDNS:
-        url = f"{cdn}/{p}/96fx96f"
-        try:
-            async with session.get(url, headers={"User-Agent": "Mozilla/5.0"}) as r:
-                if r.status == 200:
-                    content = await r.read()
-                    ct = r.headers.get("Content-Type", "image/png")
-                    return Response(
-                        content=content,
-                        media_type=ct,
-                        headers={
-                            "Cache-Control": "public, max-age=86400",
-                            "Access-Control-Allow-Origin": "*",
-                        }
-                    )
-        except Exception:
-            continue
-
-    return Response(status_code=404)
\ No newline at end of file
+    async with session.get(url, headers={"User-Agent": "Mozilla/5.0"}) as r:
+        if r.status != 200:
+            return r.status, b"", ""
+        return 200, await r.read(), r.headers.get("Content-Type", "image/png")
@@ -0,0 +1,403 @@
+"""
+Рынок в памяти процесса: снапшоты всех позиций вместе с уже посчитанными
+производными — чистой выручкой и ROI по площадкам, стабильностью,
+изменением цены за 24ч. Список арбитража, графики и алерты читают
+отсюда, БД на горячем пути не трогается.
+
+Кто пишет, тот и наполняет: коллекторы после каждого коммита вызывают
+apply() со своими строками. Параллельно в БД растёт market_state.generation;
+процесс, где коллекторов нет (API при RUN_WORKERS_IN_API=false), видит
+новое поколение в follow() и перечитывает рынок из БД целиком.
+"""
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+import orjson
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from database import AsyncSessionLocal, ArbitrageSnapshot, ItemStats, MarketState
+from parsers.arbitrage import (PLATFORMS, BUFF, SELL_LABELS, compute, price_matrix,
+                              best_pair, liquidity_label)
+from stability import reasons
+
+log = logging.getLogger("market_store")
+
+VIEW_CACHE = 4   # готовых фрагментов ответа на позицию (по парам курсов юзеров)
+
+# Поля снапшота, которые хранит MarketItem (имена как в ArbitrageSnapshot)
+SNAPSHOT_ATTRS = (
+    "buff_goods_id", "icon_url", "buff_price", "cgm_price", "skinport_price",
+    "steam_price", "buff_sell_num", "buff_buy_num", "best_roi",
+    "best_sell_platform", "is_unstable", "unstable_mask", "unstable_confidence",
+    "updated_at",
+)
+
+
+def normalize_icon(icon_url: str | None) -> str | None:
+    """Всегда возвращает /api/img?p=HASH, независимо от формата в БД."""
+    if not icon_url:
+        return None
+    # Уже правильный формат
+    if icon_url.startswith("/api/img"):
+        return icon_url
+    # Старый формат: полный Steam CDN URL
+    m = re.search(r"/economy/image/([^/?]+)", icon_url)
+    if m:
+        return f"/api/img?p={m.group(1)}"
+    return icon_url
+
+
+class MarketItem:
+    """Снапшот позиции + производные, не зависящие от валюты юзера."""
+    __slots__ = (*SNAPSHOT_ATTRS, "name", "first_24h", "platforms",
+                 "best_pair", "price_change_24h", "unstable_reasons",
+                 "liquidity", "_head", "_sig", "_views")
+
+    def __init__(self, name: str):
+        self.name = name
+        for a in SNAPSHOT_ATTRS:
+            setattr(self, a, None)
+        self.buff_sell_num = self.buff_buy_num = 0
+        self.best_roi = 0.0
+        self.first_24h: float | None = None   # цена Buff на начало 24ч окна
+        # pkey -> (JSON площадки без валютных полей и «}», выручка USD, профит USD, ROI)
+        self.platforms: dict[str, tuple[bytes, float, float, float]] = {}
+        self.best_pair: dict | None = None    # лучшая пара «купить — продать» по всем площадкам
+        self.price_change_24h: float | None = None
+        self.is_unstable = False
+        self.unstable_mask = 0
+        self.unstable_confidence = 0.0
+        self.unstable_reasons: list[str] = []
+        self.liquidity = "low"
+        self._head = b""                      # JSON позиции без валютных полей и «}»
+        self._sig = b""                       # всё видимое клиенту, кроме updated_at
+        self._views: dict[tuple, bytes] = {}
+
+    def update(self, row: dict):
+        for a in SNAPSHOT_ATTRS:
+            if a in row:
+                setattr(self, a, row[a])
+        self.icon_url = normalize_icon(self.icon_url)
+
+    def prices(self) -> dict[str, float]:
+        """Текущие цены по площадкам (ключи — имена из items.PLATFORMS)."""
+        out = {"buff": self.buff_price, "cgm": self.cgm_price,
+               "skinport": self.skinport_price, "steam": self.steam_price}
+        return {p: v for p, v in out.items() if v}
+
+    def derive(self, net: list, profit: list, roi: list, pair: dict | None):
+        """
+        Производные позиции. net — выручка по площадкам, profit/roi — при
+        покупке на Buff (строки матриц parsers.arbitrage, NaN — нет цены);
+        вызывается из derive_all() пачкой.
+        """
+        buff = self.buff_price or 0
+        platforms = {}
+        for j, pkey in enumerate(PLATFORMS):
+            if j == BUFF or roi[j] != roi[j]:
+                continue
+            # Валюта юзера досчитывается на запросе из выручки и профита в USD
+            head = orjson.dumps({
+                "label":      SELL_LABELS[pkey],
+                "sell_price": round(getattr(self, f"{pkey}_price"), 2),
+                "net_usd":    round(net[j], 2),
+                "profit_usd": round(profit[j], 2),
+                "roi":        roi[j],
+            })[:-1]
+            platforms[pkey] = (b'"%s":%s' % (pkey.encode(), head), net[j], profit[j], roi[j])
+        self.platforms = platforms
+        self.best_pair = pair
+
+        self.price_change_24h = None
+        if self.first_24h and self.first_24h > 0:
+            self.price_change_24h = round((buff - self.first_24h) / self.first_24h * 100, 1)
+        # Стабильность посчитал коллектор (stability.py) — здесь только расшифровка маски
+        self.unstable_reasons = reasons(self.unstable_mask)
+        sell_num = self.buff_sell_num or 0
+        self.liquidity = liquidity_label(sell_num)
+
+        # Всё, что не зависит от валюты, сериализуется здесь — раз на изменение позиции
+        body = orjson.dumps({
+            "name":             self.name,
+            "icon_url":         self.icon_url,
+            "buff_price":       self.buff_price,
+            "best_roi":         self.best_roi,
+            "best_sell":        self.best_sell_platform,
+            "sell_num":         self.buff_sell_num,
+            "buy_num":          self.buff_buy_num,
+            "liquidity":        self.liquidity,
+            "price_change_24h": self.price_change_24h,
+            "is_unstable":      bool(self.is_unstable),
+            "unstable_reason":  self.unstable_reasons[0] if self.unstable_reasons else None,
+            "unstable_reasons": self.unstable_reasons,
+            "unstable_confidence": self.unstable_confidence or 0.0,
+            "best_pair":        self.best_pair,
+        })[:-1]
+        self._head = b'%s,"updated_at":"%s"' % (body, self.updated_at.isoformat().encode())
+        # Одна отметка свежести без других изменений — не изменение (для дельт stream)
+        self._sig = body + b"".join(p[0] for p in platforms.values())
+        self._views = {}
+
+    def fragment(self, cny_usd: float, usd_rub: float) -> bytes:
+        """
+        Элемент ответа /api/arbitrage/list (JSON-объект) в валютах юзера:
+        готовый _head плюс валютные поля. Кэшируется по паре курсов до
+        следующего изменения позиции — у большинства юзеров курсы по умолчанию.
+        """
+        key = (cny_usd, usd_rub)
+        v = self._views.get(key)
+        if v is not None:
+            return v
+        inv_cny = 1 / cny_usd if cny_usd else 0
+        buff = self.buff_price or 0
+        # repr(float) — тот же кратчайший вид, что у JSON-кодировщиков
+        platforms = b",".join(
+            head + (f',"net_cny":{round(net_usd * inv_cny, 0)!r},'
+                    f'"net_rub":{round(net_usd * usd_rub, 0)!r},'
+                    f'"profit_cny":{round(profit * inv_cny, 0)!r},'
+                    f'"profit_rub":{round(profit * usd_rub, 0)!r}}}').encode()
+            for head, net_usd, profit, _ in self.platforms.values()
+        )
+        v = b"".join((
+            self._head,
+            f',"buff_price_cny":{round(buff * inv_cny, 0)!r},'
+            f'"buff_price_rub":{round(buff * usd_rub, 0)!r},"platforms":{{'.encode(),
+            platforms, b"}}",
+        ))
+        if len(self._views) >= VIEW_CACHE:
+            self._views.clear()
+        self._views[key] = v
+        return v
+
+
+def derive_all(items: list[MarketItem]):
+    """Производные пачки позиций: арбитраж — одной матрицей на всю пачку."""
+    if not items:
+        return
+    arb = compute(price_matrix([it.prices() for it in items]))
+    buy, sell, pair_roi = best_pair(arb)
+    net = arb.net.tolist()
+    profit, roi = arb.profit[:, BUFF].tolist(), arb.roi[:, BUFF].tolist()
+    for i, it in enumerate(items):
+        pair = None
+        if buy[i] >= 0:
+            pair = {"buy": PLATFORMS[buy[i]], "sell": PLATFORMS[sell[i]],
+                    "roi": float(pair_roi[i])}
+        it.derive(net[i], profit[i], roi[i], pair)
+
+
+# Порядки списка: ключ (значение, name). name разрывает ничьи, поэтому ключ
+# однозначно задаёт место позиции в порядке и годится курсором keyset-пагинации
+SORT_KEYS = {
+    "roi":     lambda it: (-(it.best_roi or 0), it.name),
+    "price":   lambda it: (it.buff_price or 0, it.name),
+    "updated": lambda it: (-(it.updated_at.timestamp() if it.updated_at else 0), it.name),
+}
+_NAME_MAX = "\U0010ffff"   # больше любого имени: верхняя граница для bisect
+
+
+class MarketStore:
+    def __init__(self):
+        self.items: dict[str, MarketItem] = {}
+        # sort -> (позиции в порядке sort, их ключи для bisect)
+        self.indexes: dict[str, tuple[list[MarketItem], list[tuple]]] = {
+            sort: ([], []) for sort in SORT_KEYS
+        }
+        self.generation = 0                    # растёт на каждое изменение в памяти
+        self.db_generation: int | None = None  # market_state.generation, которому соответствуем
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        # Журнал последних поколений: (поколение, изменённые имена, удалённые имена)
+        self.changes: deque[tuple[int, frozenset, frozenset]] = deque(
+            maxlen=get_settings().STREAM_BACKLOG
+        )
+        self._changed = asyncio.Event()        # взводится и заменяется на каждое поколение
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at > 0
+
+    def get(self, name: str) -> MarketItem | None:
+        return self.items.get(name)
+
+    def _reindex(self, changed: set[str], removed: set[str] = frozenset()):
+        items = list(self.items.values())
+        indexes = {}
+        for sort, key in SORT_KEYS.items():
+            ordered = sorted(items, key=key)
+            indexes[sort] = (ordered, [key(it) for it in ordered])
+        self.indexes = indexes
+        self.generation += 1
+        self.changes.append((self.generation, frozenset(changed), frozenset(removed)))
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def changes_since(self, generation: int) -> tuple[set[str], set[str]] | None:
+        """
+        (изменённые и новые, удалённые) имена после поколения generation;
+        None — журнал столько не помнит, нужен снапшот.
+        """
+        if generation == self.generation:
+            return set(), set()
+        if generation > self.generation or not self.changes or self.changes[0][0] > generation + 1:
+            return None
+        names: set[str] = set()
+        for g, changed, removed in self.changes:
+            if g > generation:
+                names |= changed
+                names |= removed
+        present = {n for n in names if n in self.items}
+        return present, names - present
+
+    async def wait_change(self, generation: int, timeout: float) -> bool:
+        """Ждёт поколения новее generation не дольше timeout; False — не дождались."""
+        if self.generation != generation:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def page(self, sort: str = "roi", after: tuple | None = None, limit: int = 50, *,
+             min_roi: float = 0, price_min: float | None = None,
+             price_max: float | None = None, liquidity: set[str] | None = None,
+             platform: str | None = None, unstable: bool | None = None,
+             q: str | None = None) -> tuple[list[MarketItem], tuple | None]:
+        """
+        Страница списка в порядке sort после ключа after (keyset).
+        Возвращает позиции и ключ последней, если дальше есть ещё.
+        Границы по своему ключу (min_roi для roi, цена для price) режутся
+        bisect'ом, остальные фильтры проверяются по ходу обхода.
+        """
+        ordered, keys = self.indexes[sort]
+        lo, hi = 0, len(keys)
+        if sort == "roi":
+            hi = bisect_right(keys, (-min_roi, _NAME_MAX))
+        elif sort == "price":
+            if price_min is not None:
+                lo = bisect_left(keys, (price_min,))
+            if price_max is not None:
+                hi = bisect_right(keys, (price_max, _NAME_MAX))
+        if after is not None:
+            lo = max(lo, bisect_right(keys, after))
+        q = q.lower() if q else None
+
+        out: list[MarketItem] = []
+        for i in range(lo, hi):
+            it = ordered[i]
+            price = it.buff_price or 0
+            if ((it.best_roi or 0) < min_roi
+                    or (price_min is not None and price < price_min)
+                    or (price_max is not None and price > price_max)
+                    or (liquidity and it.liquidity not in liquidity)
+                    or (platform and it.best_sell_platform != platform)
+                    or (unstable is not None and bool(it.is_unstable) != unstable)
+                    or (q and q not in it.name.lower())):
+                continue
+            if len(out) == limit:
+                return out, SORT_KEYS[sort](out[-1])
+            out.append(it)
+        return out, None
+
+    # ── Запись ────────────────────────────────────────────────────────────────
+    def apply(self, rows: list[dict], db_generation: int | None = None):
+        """
+        Вливает строки коллектора после коммита. Строка с buff_price может
+        завести новую позицию, частичные строки (Steam) только дополняют
+        известные. first_24h в строке — из item_stats.
+        """
+        touched: dict[str, MarketItem] = {}
+        before: dict[str, bytes] = {}
+        for row in rows:
+            it = self.items.get(row["name"])
+            if it is None:
+                if "buff_price" not in row:
+                    continue
+                it = self.items[row["name"]] = MarketItem(row["name"])
+                it.first_24h = row["buff_price"]
+            before.setdefault(it.name, it._sig)
+            it.update(row)
+            if "first_24h" in row:
+                it.first_24h = row["first_24h"]
+            touched[it.name] = it
+        derive_all(list(touched.values()))
+        self._reindex({n for n, it in touched.items() if it._sig != before[n]})
+        if db_generation is not None:
+            self.db_generation = db_generation
+
+    # ── Загрузка из БД ────────────────────────────────────────────────────────
+    async def _load(self, db: AsyncSession):
+        t0 = time.perf_counter()
+        # Поколение читаем до данных: запись между запросами даст лишнюю, а не пропущенную перезагрузку
+        generation = await read_generation(db)
+
+        # Цена на начало 24ч окна — из item_stats, которую ведут коллекторы
+        res = await db.execute(
+            select(ArbitrageSnapshot, ItemStats.first_24h)
+            .outerjoin(ItemStats, ItemStats.item_id == ArbitrageSnapshot.item_id)
+        )
+        items: dict[str, MarketItem] = {}
+        for s, first_24h in res.all():
+            it = items[s.name] = MarketItem(s.name)
+            it.update({a: getattr(s, a) for a in SNAPSHOT_ATTRS})
+            it.first_24h = first_24h
+
+        derive_all(list(items.values()))
+        old, self.items = self.items, items
+        self._reindex(
+            {n for n, it in items.items() if n not in old or old[n]._sig != it._sig},
+            old.keys() - items.keys(),
+        )
+        self.db_generation = generation
+        self.loaded_at = time.time()
+        log.info(f"🗄 Рынок из БД: {len(items)} позиций, поколение {generation}, "
+                 f"{(time.perf_counter() - t0) * 1000:.0f} мс")
+
+    async def reload(self, db: AsyncSession | None = None, cold_only: bool = False):
+        async with self._lock:
+            if cold_only and self.ready:
+                return
+            if db is not None:
+                await self._load(db)
+                return
+            async with AsyncSessionLocal() as own:
+                await self._load(own)
+
+    async def ensure_loaded(self, db: AsyncSession | None = None):
+        """Холодный старт: грузит рынок из БД, если в памяти его ещё нет."""
+        if not self.ready:
+            await self.reload(db, cold_only=True)
+
+    async def follow(self):
+        """
+        Следит за market_state.generation и перечитывает рынок, когда его
+        поменял другой процесс. Раз в STORE_RELOAD перечитывает в любом
+        случае — сдвигается 24ч окно.
+        """
+        settings = get_settings()
+        while True:
+            await asyncio.sleep(settings.STORE_POLL)
+            try:
+                async with AsyncSessionLocal() as db:
+                    generation = await read_generation(db)
+                    stale = time.time() - self.loaded_at > settings.STORE_RELOAD
+                    if generation != self.db_generation or stale:
+                        await self.reload(db)
+            except Exception as e:
+                log.error(f"market_store: {e}")
+
+
+async def read_generation(db: AsyncSession) -> int:
+    res = await db.execute(select(MarketState.generation).where(MarketState.id == 1))
+    return res.scalar_one_or_none() or 0
+
+
+market_store = MarketStore()
@@ -1,12 +1,29 @@
 """
+Арбитраж по матрице цен: позиции × площадки, все пары «купить на X —
+продать на Y» одним проходом NumPy.
+
 Комиссии при продаже (платит продавец):
+  Buff.163   — 2.5%
   CSGOMarket — 7%
   Skinport   — 12%
   Steam      — 15%
   CSFloat    — 2%
+
+Единственное место, где живут комиссии и формулы: коллекторы считают
+здесь best_roi снапшотов, рынок в памяти — выдачу по площадкам и лучшую
+пару, API — сделки портфеля.
 """
+from typing import NamedTuple
+
+import numpy as np
+
+# Столбцы матрицы цен. Порядок — индексы в результатах compute()
+PLATFORMS = ("buff", "cgm", "skinport", "steam", "csfloat")
+INDEX = {p: i for i, p in enumerate(PLATFORMS)}
+BUFF = INDEX["buff"]
 
 FEES = {
+    "buff":     0.025,
     "cgm":      0.07,
     "skinport": 0.12,
     "steam":    0.15,
@@ -21,42 +38,70 @@ LABELS = {
     "csfloat":  "CSFloat",
 }
 
+# Подпись площадки продажи в выдаче: «CSGOMarket (-7%)»
+SELL_LABELS = {p: f"{LABELS[p]} (-{FEES[p] * 100:g}%)" for p in PLATFORMS}
+
+_KEEP = 1 - np.array([FEES[p] for p in PLATFORMS])
+_SAME = np.arange(len(PLATFORMS))
+
+
+class Arbitrage(NamedTuple):
+    prices: np.ndarray   # (n, P), NaN — цены нет
+    net:    np.ndarray   # (n, P) выручка после комиссии при продаже на площадке
+    profit: np.ndarray   # (n, P, P) [позиция, где купить, где продать]
+    roi:    np.ndarray   # (n, P, P) в %, до 0.1; NaN — пары нет
+
+
+def price_matrix(rows: list[dict[str, float | None]]) -> np.ndarray:
+    """[{площадка: цена}] → (n, P); отсутствующие и неположительные цены — NaN."""
+    m = np.empty((len(rows), len(PLATFORMS)))
+    for j, p in enumerate(PLATFORMS):
+        m[:, j] = [row.get(p) or np.nan for row in rows]
+    with np.errstate(invalid="ignore"):
+        m[~(m > 0)] = np.nan
+    return m
+
+
+def compute(prices: np.ndarray) -> Arbitrage:
+    """Выручка, профит и ROI по всем парам площадок для всех позиций разом."""
+    net = prices * _KEEP
+    profit = net[:, None, :] - prices[:, :, None]
+    with np.errstate(invalid="ignore"):
+        roi = np.round(profit / prices[:, :, None] * 100, 1)
+    roi[:, _SAME, _SAME] = np.nan   # купить и продать на одной площадке — не арбитраж
+    return Arbitrage(prices, net, profit, roi)
+
+
+def _argmax(roi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """По последней оси: (индекс максимума или -1, максимум или 0.0)."""
+    filled = np.where(np.isnan(roi), -np.inf, roi)
+    idx = filled.argmax(axis=-1)
+    best = np.take_along_axis(filled, idx[..., None], axis=-1)[..., 0]
+    found = np.isfinite(best)
+    return np.where(found, idx, -1), np.where(found, best, 0.0)
+
+
+def best_sell(arb: Arbitrage, buy: int = BUFF) -> tuple[np.ndarray, np.ndarray]:
+    """Лучшая площадка продажи при покупке на buy: (индекс или -1, ROI)."""
+    return _argmax(arb.roi[:, buy, :])
+
+
+def best_pair(arb: Arbitrage) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Лучшая пара по всем площадкам: (купить, продать — индексы или -1, ROI)."""
+    n, p = arb.roi.shape[:2]
+    idx, roi = _argmax(arb.roi.reshape(n, p * p))
+    return np.where(idx >= 0, idx // p, -1), np.where(idx >= 0, idx % p, -1), roi
+
 
-def calc_arbitrage(buy_price: float, market_prices: dict[str, float | None],
-                   usd_rub: float = 90.0) -> dict:
+def best_from_buff(rows: list[dict[str, float | None]]) -> list[tuple[str | None, float]]:
     """
-    buy_price      — цена покупки на Buff (USD)
-    market_prices  — {"cgm": 45.0, "skinport": 43.0, ...}  None если нет данных
+    (лучшая площадка, ROI) при покупке на Buff для каждой строки
+    {площадка: цена}; цена Buff — под ключом "buff". Без продаж — (None, 0.0).
     """
-    platforms = {}
-    for platform, sell in market_prices.items():
-        if not sell or sell <= 0:
-            continue
-        fee     = FEES.get(platform, 0.0)
-        net     = sell * (1 - fee)
-        profit  = net - buy_price
-        roi     = profit / buy_price * 100 if buy_price > 0 else 0
-        platforms[platform] = {
-            "label":      LABELS.get(platform, platform),
-            "sell_price": round(sell, 2),
-            "net_usd":    round(net, 2),
-            "net_rub":    round(net * usd_rub, 0),
-            "profit_usd": round(profit, 2),
-            "profit_rub": round(profit * usd_rub, 0),
-            "roi":        round(roi, 1),
-        }
-
-    if not platforms:
-        return {"platforms": {}, "best": None, "best_roi": 0.0, "best_profit_usd": 0.0}
-
-    best = max(platforms, key=lambda k: platforms[k]["roi"])
-    return {
-        "platforms":       platforms,
-        "best":            best,
-        "best_roi":        platforms[best]["roi"],
-        "best_profit_usd": platforms[best]["profit_usd"],
-        "best_profit_rub": platforms[best]["profit_rub"],
-    }
+    if not rows:
+        return []
+    idx, roi = best_sell(compute(price_matrix(rows)))
+    return [(PLATFORMS[i] if i >= 0 else None, r) for i, r in zip(idx.tolist(), roi.tolist())]
 
 
 def liquidity_label(sell_num: int) -> str:
@@ -6,34 +6,28 @@ import time
 log = logging.getLogger("parser.buff")
 
 
-async def fetch_buff_page(session: aiohttp.ClientSession, buff_session: str,
-                           page: int, cny_usd: float,
-                           category: str = "knife") -> list[dict]:
+PAGE_SIZE = 50
+
+BUFF_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Referer": "https://buff.163.com/market/csgo",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+async def _buff_get(session: aiohttp.ClientSession, buff_session: str,
+                    url: str, params: dict, meta: dict,
+                    sleep_on_429: bool) -> dict | None:
     """
-    Грузит страницу товаров с Buff.
-    category: knife | rifle | pistol | '' (пустая = все)
+    GET к API Buff. Возвращает data из ответа при code == OK, иначе None.
+    В meta["status"] пишется ok | rate_limited | expired | error.
     """
-    url = "https://buff.163.com/api/market/goods"
-    params = {
-        "game": "csgo",
-        "page_num": page,
-        "page_size": 50,
-        "sort_by": "price.asc",
-    }
-    if category:
-        params["category_group"] = category
-
-    headers = {
-        "Cookie": f"session={buff_session}",
-        "User-Agent": (
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/120.0.0.0 Safari/537.36"
-        ),
-        "Referer": "https://buff.163.com/market/csgo",
-        "Accept-Language": "en-US,en;q=0.9",
-    }
-
+    meta["status"] = "error"
+    headers = {**BUFF_HEADERS, "Cookie": f"session={buff_session}"}
     try:
         async with session.get(url, params=params, headers=headers,
                                timeout=aiohttp.ClientTimeout(total=15)) as resp:
@@ -45,54 +39,22 @@ async def fetch_buff_page(session: aiohttp.ClientSession, buff_session: str,
                     msg = str(data.get("error", code))
                     if "login" in msg.lower() or code in ("Login", "NotLogin"):
                         log.error("BUFF_SESSION протух — нужно обновить!")
-                        return [{"_session_expired": True}]
+                        meta["status"] = "expired"
+                        return None
                     log.warning(f"Buff API: {msg}")
-                    return []
-
-                items = data.get("data", {}).get("items", [])
-                result = []
-
-                for item in items:
-                    try:
-                        price_cny = float(item.get("sell_min_price", 0) or 0)
-                        if price_cny <= 0:
-                            continue
-
-                        price_usd = round(price_cny * cny_usd, 2)
-                        goods_id  = str(item.get("id", ""))
-                        name      = item.get("market_hash_name", "")
-                        goods_info = item.get("goods_info", {}) or {}
-                        icon_path  = goods_info.get("icon_url", "")
-
-                        # Сохраняем raw path — CDN подставляется через прокси
-                        steam_img = None
-                        if icon_path:
-                            steam_img = f"/api/img?p={icon_path}"
-
-                        steam_cny = float(goods_info.get("steam_price", 0) or 0)
-
-                        result.append({
-                            "id":        goods_id,
-                            "name":      name,
-                            "price_cny": price_cny,
-                            "price_usd": price_usd,
-                            "sell_num":  int(item.get("sell_num", 0) or 0),
-                            "buy_num":   int(item.get("buy_num", 0) or 0),
-                            "steam_usd": round(steam_cny * cny_usd, 2) if steam_cny > 0 else None,
-                            "icon_url":  steam_img,
-                            "buff_url":  f"https://buff.163.com/goods/{goods_id}",
-                        })
-                    except Exception:
-                        continue
-
-                return result
+                    return None
+
+                meta["status"] = "ok"
+                return data.get("data", {}) or {}
 
             elif resp.status == 429:
-                log.warning("Buff rate limit — ждём 60с")
-                await asyncio.sleep(60)
+                meta["status"] = "rate_limited"
+                if sleep_on_429:
+                    log.warning("Buff rate limit — ждём 60с")
+                    await asyncio.sleep(60)
             elif resp.status in (401, 403):
                 log.error("Buff: доступ запрещён (сессия?)")
-                return [{"_session_expired": True}]
+                meta["status"] = "expired"
             else:
                 log.error(f"Buff HTTP {resp.status}")
 
@@ -101,7 +63,120 @@ async def fetch_buff_page(session: aiohttp.ClientSession, buff_session: str,
     except Exception as e:
         log.error(f"Buff ошибка: {e}")
 
-    return []
+    return None
+
+
+def _icon(goods_info: dict) -> str | None:
+    # Сохраняем raw path — CDN подставляется через прокси
+    icon_path = goods_info.get("icon_url", "")
+    return f"/api/img?p={icon_path}" if icon_path else None
+
+
+async def fetch_buff_page(session: aiohttp.ClientSession, buff_session: str,
+                           page: int, cny_usd: float,
+                           category: str = "knife",
+                           meta: dict | None = None) -> list[dict]:
+    """
+    Грузит страницу товаров с Buff.
+    category: knife | rifle | pistol | '' (пустая = все)
+    meta: если передан, сюда пишутся total_page из ответа и status:
+          ok | rate_limited | expired | error. С meta на 429 не спим —
+          паузу решает вызывающий (пул сессий)
+    """
+    params = {
+        "game": "csgo",
+        "page_num": page,
+        "page_size": PAGE_SIZE,
+        "sort_by": "price.asc",
+    }
+    if category:
+        params["category_group"] = category
+
+    status: dict = meta if meta is not None else {}
+    data = await _buff_get(session, buff_session, "https://buff.163.com/api/market/goods",
+                           params, status, sleep_on_429=meta is None)
+    if status["status"] == "expired":
+        return [{"_session_expired": True}]
+    if data is None:
+        return []
+
+    status["total_page"] = data.get("total_page")
+    result = []
+    for item in data.get("items", []):
+        try:
+            price_cny = float(item.get("sell_min_price", 0) or 0)
+            if price_cny <= 0:
+                continue
+
+            price_usd = round(price_cny * cny_usd, 2)
+            goods_id  = str(item.get("id", ""))
+            name      = item.get("market_hash_name", "")
+            goods_info = item.get("goods_info", {}) or {}
+            steam_cny = float(goods_info.get("steam_price", 0) or 0)
+
+            result.append({
+                "id":        goods_id,
+                "name":      name,
+                "price_cny": price_cny,
+                "price_usd": price_usd,
+                "sell_num":  int(item.get("sell_num", 0) or 0),
+                "buy_num":   int(item.get("buy_num", 0) or 0),
+                "steam_usd": round(steam_cny * cny_usd, 2) if steam_cny > 0 else None,
+                "icon_url":  _icon(goods_info),
+                "buff_url":  f"https://buff.163.com/goods/{goods_id}",
+            })
+        except Exception:
+            continue
+
+    return result
+
+
+async def fetch_buff_item(session: aiohttp.ClientSession, buff_session: str,
+                          goods_id: str, cny_usd: float,
+                          meta: dict) -> dict | None:
+    """
+    Свежая цена одной позиции по её лотам на продажу (один запрос на позицию).
+    Формат как у элементов fetch_buff_page, но buy_num неизвестен (None),
+    а name может быть пустым, если Buff не прислал goods_infos.
+    """
+    params = {
+        "game": "csgo",
+        "goods_id": goods_id,
+        "page_num": 1,
+        "page_size": 10,
+        "sort_by": "default",
+    }
+    data = await _buff_get(session, buff_session,
+                           "https://buff.163.com/api/market/goods/sell_order",
+                           params, meta, sleep_on_429=False)
+    if data is None:
+        return None
+
+    prices = []
+    for order in data.get("items", []):
+        try:
+            price = float(order.get("price", 0) or 0)
+        except (TypeError, ValueError):
+            continue
+        if price > 0:
+            prices.append(price)
+    if not prices:
+        return None
+
+    goods_info = (data.get("goods_infos") or {}).get(str(goods_id), {}) or {}
+    price_cny = min(prices)
+    steam_cny = float(goods_info.get("steam_price", 0) or 0)
+    return {
+        "id":        str(goods_id),
+        "name":      goods_info.get("market_hash_name", ""),
+        "price_cny": price_cny,
+        "price_usd": round(price_cny * cny_usd, 2),
+        "sell_num":  int(data.get("total_count", 0) or 0),
+        "buy_num":   None,
+        "steam_usd": round(steam_cny * cny_usd, 2) if steam_cny > 0 else None,
+        "icon_url":  _icon(goods_info),
+        "buff_url":  f"https://buff.163.com/goods/{goods_id}",
+    }
 
 
 async def fetch_cny_usd_rate(session: aiohttp.ClientSession) -> float:
@@ -0,0 +1,107 @@
+"""
+Пул Buff сессий: все сохранённые User.buff_session, у каждой куки —
+свой token bucket и состояние здоровья. Запросы уходят в ту здоровую
+куку, у которой раньше всех освободится токен, поэтому пропускная
+способность растёт с числом живых кук.
+"""
+import asyncio
+import logging
+import time
+
+from parsers.ratelimit import RateLimiter
+
+log = logging.getLogger("parser.buff_pool")
+
+RATE_LIMIT_COOLDOWN = 60     # первая пауза после 429, дальше удваивается
+MAX_COOLDOWN        = 600
+ERROR_COOLDOWN      = 30     # пауза после ERROR_STREAK ошибок подряд
+ERROR_STREAK        = 3
+
+
+class BuffSession:
+    def __init__(self, tg_id: int, cookie: str, rps: float, burst: int):
+        self.tg_id   = tg_id
+        self.cookie  = cookie
+        self.limiter = RateLimiter(rps, burst=burst)
+        self.cooldown_until = 0.0
+        self.rate_limits = 0   # 429 подряд
+        self.errors      = 0   # прочих ошибок подряд
+        self.requests    = 0
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def cool_down(self, seconds: float):
+        self.cooldown_until = time.monotonic() + seconds
+
+
+class BuffSessionPool:
+    def __init__(self, rps: float, burst: int = 1):
+        self.rps   = rps
+        self.burst = burst
+        self.sessions: dict[str, BuffSession] = {}   # cookie -> сессия
+        self.dead: set[str] = set()                  # протухшие куки
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def sync(self, cookies: dict[int, str]):
+        """
+        Приводит пул к списку кук из БД (tg_id -> cookie). Состояние уже
+        известных кук сохраняется, протухшие не возвращаются, пока юзер
+        не пришлёт новую через /buff.
+        """
+        alive = {c: tg for tg, c in cookies.items() if c and c not in self.dead}
+        for cookie in list(self.sessions):
+            if cookie not in alive:
+                del self.sessions[cookie]
+        for cookie, tg_id in alive.items():
+            if cookie not in self.sessions:
+                self.sessions[cookie] = BuffSession(tg_id, cookie, self.rps, self.burst)
+                log.info(f"🍪 Buff сессия {tg_id} добавлена в пул")
+
+    async def acquire(self) -> BuffSession | None:
+        """
+        Ждёт токен у самой свободной здоровой куки.
+        None — живых кук в пуле не осталось.
+        """
+        while self.sessions:
+            healthy = [s for s in self.sessions.values() if s.healthy()]
+            if not healthy:
+                wake = min(s.cooldown_until for s in self.sessions.values())
+                await asyncio.sleep(max(0.0, wake - time.monotonic()))
+                continue
+            s = min(healthy, key=lambda s: s.limiter.ready_in())
+            await s.limiter.acquire()
+            if s.cookie in self.sessions and s.healthy():
+                s.requests += 1
+                return s
+        return None
+
+    def report(self, s: BuffSession, status: str):
+        """status: ok | rate_limited | expired | error (см. fetch_buff_page)."""
+        if status == "ok":
+            s.rate_limits = s.errors = 0
+        elif status == "rate_limited":
+            if not s.healthy():
+                return  # 429 от запросов, ушедших до паузы, — пауза уже идёт
+            s.rate_limits += 1
+            pause = min(MAX_COOLDOWN, RATE_LIMIT_COOLDOWN * 2 ** (s.rate_limits - 1))
+            s.cool_down(pause)
+            log.warning(f"Buff 429 на сессии {s.tg_id} — пауза {pause}с")
+        elif status == "expired":
+            if s.cookie in self.dead:
+                return
+            self.dead.add(s.cookie)
+            self.sessions.pop(s.cookie, None)
+            log.error(f"Buff сессия {s.tg_id} протухла — исключена из пула "
+                      f"(живых: {len(self.sessions)})")
+        else:
+            s.errors += 1
+            if s.errors >= ERROR_STREAK:
+                s.cool_down(ERROR_COOLDOWN)
+                s.errors = 0
+
+    def stats(self) -> str:
+        healthy = sum(1 for s in self.sessions.values() if s.healthy())
+        return f"{healthy}/{len(self.sessions)} здоровых, {len(self.dead)} протухших"
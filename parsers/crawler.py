@@ -0,0 +1,170 @@
+"""
+Полный обход каталога Buff.
+
+Каталог шардируется по category_group, страницы качаются конкурентно
+через пул Buff сессий, а курсор (шард, страница) переживает тики —
+каждый тик продолжает с места, где остановился предыдущий.
+Бюджет страниц и число запросов в полёте масштабируются числом живых кук.
+"""
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from parsers.buff import fetch_buff_page
+from parsers.buff_pool import BuffSessionPool
+
+log = logging.getLogger("parser.crawler")
+
+ALL_VIEW = "all"  # общий вид каталога без category_group
+PAGE_RETRIES = 2  # повторов страницы на другой куке после 429 / протухания
+PROBE_FAILS  = 3  # тиков подряд без total_page — шард пропускается до следующего круга
+
+
+class BuffCrawler:
+    """
+    categories     — шарды: category_group Buff или ALL_VIEW
+    pages_per_tick — бюджет страниц на тик в расчёте на одну куку
+    concurrency    — запросов в полёте на одну куку
+    """
+
+    def __init__(self, categories: list[str], pages_per_tick: int, concurrency: int):
+        self.categories     = categories or [ALL_VIEW]
+        self.pages_per_tick = pages_per_tick
+        self.concurrency    = concurrency
+        self.last_budget    = pages_per_tick
+
+        # Курсор: следующая страница, которую нужно скачать
+        self.shard = 0
+        self.page  = 1
+        # category -> total_page из последнего ответа Buff
+        self.total_pages: dict[str, int] = {}
+        # Пробная страница шарда с неизвестным total_page и неудачные пробы подряд
+        self._probe: tuple[str, int] | None = None
+        self.probe_fails: dict[str, int] = {}
+        self.cycle_started = time.time()
+        self.session_expired = False
+
+    # ── Курсор ────────────────────────────────────────────────────────────────
+    def _next_shard(self):
+        self.shard += 1
+        self.page = 1
+        if self.shard >= len(self.categories):
+            self.shard = 0
+            took = time.time() - self.cycle_started
+            log.info(f"🔁 Каталог Buff пройден целиком за {took / 60:.1f} мин")
+            self.cycle_started = time.time()
+
+    def _plan(self, budget: int) -> list[tuple[str, int]]:
+        """
+        Набирает страницы до budget, двигая курсор. На шарде с неизвестным
+        числом страниц останавливается после одной — её ответ сообщит total_page;
+        курсор сдвигает _settle_probe(), когда ответ получен.
+        """
+        plan: list[tuple[str, int]] = []
+        passed = 0
+        while len(plan) < budget and passed <= len(self.categories):
+            cat = self.categories[self.shard]
+            total = self.total_pages.get(cat)
+            if total is None:
+                plan.append((cat, self.page))
+                self._probe = (cat, self.page)
+                break
+            if self.page > total:
+                self._next_shard()
+                passed += 1
+                continue
+            n = min(budget - len(plan), total - self.page + 1)
+            plan.extend((cat, p) for p in range(self.page, self.page + n))
+            self.page += n
+        return plan
+
+    def _settle_probe(self) -> bool:
+        """
+        После загрузки плана: проба удалась — курсор за неё; нет — повтор
+        в следующем тике, после PROBE_FAILS неудач подряд шард пропускается.
+        False — тик дальше не продолжаем.
+        """
+        if self._probe is None:
+            return True
+        cat, page = self._probe
+        self._probe = None
+        if cat in self.total_pages:
+            self.probe_fails.pop(cat, None)
+            self.page = page + 1
+            return True
+        if self.session_expired:
+            return False
+        fails = self.probe_fails[cat] = self.probe_fails.get(cat, 0) + 1
+        if fails >= PROBE_FAILS:
+            log.warning(f"Buff crawler: шард {cat!r} не отвечает {fails} тиков подряд "
+                        f"(опечатка в BUFF_CATEGORIES?) — пропускаем до следующего круга")
+            self.probe_fails.pop(cat, None)
+            self._next_shard()
+        return False
+
+    def cycle_ticks(self) -> int | None:
+        """Сколько тиков занимает полный обход (когда размеры всех шардов известны)."""
+        if any(c not in self.total_pages for c in self.categories):
+            return None
+        pages = sum(self.total_pages.values())
+        return -(-pages // self.last_budget)
+
+    # ── Загрузка ──────────────────────────────────────────────────────────────
+    async def _fetch(self, session: aiohttp.ClientSession, sem: asyncio.Semaphore,
+                     pool: BuffSessionPool, cny_usd: float,
+                     cat: str, page: int) -> list[dict]:
+        async with sem:
+            for _ in range(1 + PAGE_RETRIES):
+                bs = await pool.acquire()
+                if bs is None:
+                    self.session_expired = True
+                    return []
+                meta: dict = {}
+                items = await fetch_buff_page(session, bs.cookie, page, cny_usd,
+                                              category="" if cat == ALL_VIEW else cat,
+                                              meta=meta)
+                pool.report(bs, meta["status"])
+                if meta["status"] == "ok":
+                    if meta.get("total_page") is not None:
+                        self.total_pages[cat] = int(meta["total_page"])
+                    return items
+                if meta["status"] == "error":
+                    return []
+        return []
+
+    async def tick(self, session: aiohttp.ClientSession, pool: BuffSessionPool,
+                   cny_usd: float) -> list[dict]:
+        """Качает очередную порцию каталога: pages_per_tick страниц на каждую живую куку."""
+        self.session_expired = False
+        sessions = max(1, len(pool))
+        sem = asyncio.Semaphore(self.concurrency * sessions)
+        budget = self.last_budget = self.pages_per_tick * sessions
+        items: list[dict] = []
+
+        while budget > 0 and not self.session_expired:
+            plan = self._plan(budget)
+            if not plan:
+                break
+            budget -= len(plan)
+            pages = await asyncio.gather(*(
+                self._fetch(session, sem, pool, cny_usd, cat, page)
+                for cat, page in plan
+            ))
+            for page_items in pages:
+                items.extend(page_items)
+            if not self._settle_probe():
+                break
+
+        done = self.last_budget - budget
+        cycle = self.cycle_ticks()
+        log.info(f"Buff crawler: {done} стр., {len(items)} позиций, "
+                 f"курсор {self.categories[self.shard]}:{self.page}, пул: {pool.stats()}"
+                 + (f", полный обход ≈ {cycle} тиков" if cycle else ""))
+        return items
+
+
+def parse_categories(raw: str) -> list[str]:
+    """'knife, rifle ,all' -> ['knife', 'rifle', 'all']"""
+    return [c.strip() for c in raw.split(",") if c.strip()]
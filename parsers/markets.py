@@ -1,18 +1,147 @@
 import aiohttp
 import asyncio
+import json
 import logging
+import os
 import time
 
+import ijson
+
+from config import get_settings
+
 log = logging.getLogger("parser.markets")
 
 # ── Кэши ──────────────────────────────────────────────────────────────────────
-_cgm_cache: dict[str, float] = {}
-_cgm_ts:    float = 0
+CACHE_TTL = 300  # 5 мин
 
-_sp_cache:  dict[str, float] = {}
-_sp_ts:     float = 0
 
-CACHE_TTL = 300  # 5 мин
+class _Dump:
+    """
+    Кэш одного дампа цен: dict в памяти + компактный JSON на диске
+    с ETag / Last-Modified для условных запросов. Возраст дампа —
+    mtime файла: на 304 файл не переписывается, только «трогается».
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.prices: dict[str, float] = {}
+        self.ts = 0.0
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self._loaded = False
+        self._saving = asyncio.Lock()   # один .tmp на дамп: записи по очереди
+
+    @property
+    def path(self) -> str:
+        return os.path.join(get_settings().MARKET_CACHE_DIR, f"{self.source}.json")
+
+    def load(self):
+        """Один раз за процесс поднимает последний удачный дамп с диска."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "rb") as f:
+                data = json.load(f)
+            self.prices = data["prices"]
+            self.etag = data.get("etag")
+            self.last_modified = data.get("last_modified")
+            self.ts = os.path.getmtime(self.path)
+            log.info(f"{self.source}: {len(self.prices)} позиций с диска, "
+                     f"возраст {time.time() - self.ts:.0f}с")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning(f"{self.source}: кэш на диске не читается: {e}")
+
+    def validators(self) -> dict[str, str]:
+        if not self.prices:
+            return {}
+        headers = {}
+        if self.etag:          headers["If-None-Match"]     = self.etag
+        if self.last_modified: headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    async def store(self, prices: dict[str, float], resp_headers):
+        self.prices = prices
+        self.etag = resp_headers.get("ETag")
+        self.last_modified = resp_headers.get("Last-Modified")
+        self.ts = time.time()
+        # Дамп — десятки тысяч позиций: сериализация и запись не в цикле событий
+        async with self._saving:
+            try:
+                await asyncio.to_thread(self._save, {
+                    "etag": self.etag, "last_modified": self.last_modified, "prices": prices,
+                })
+            except OSError as e:
+                log.warning(f"{self.source}: не удалось сохранить кэш: {e}")
+
+    def _save(self, data: dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"), ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def touch(self):
+        """304: дамп не изменился — продлеваем возраст."""
+        self.ts = time.time()
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+    def age(self) -> float | None:
+        """Возраст дампа; если в этом процессе он не грузился — по файлу на диске."""
+        ts = self.ts
+        if not ts:
+            try:
+                ts = os.path.getmtime(self.path)
+            except OSError:
+                return None
+        return time.time() - ts
+
+
+_cgm = _Dump("cgm")
+_sp  = _Dump("skinport")
+
+
+def market_cache_age() -> dict[str, float | None]:
+    """Возраст дампов в секундах (None — ещё не загружались)."""
+    return {d.source: d.age() for d in (_cgm, _sp)}
+
+
+async def _fetch_dump(session: aiohttp.ClientSession, dump: _Dump, label: str,
+                      url: str, prefix: str, price_key: str, timeout: int,
+                      params: dict | None = None,
+                      headers: dict | None = None) -> dict[str, float]:
+    dump.load()
+    if time.time() - dump.ts < CACHE_TTL and dump.prices:
+        return dump.prices
+    try:
+        async with session.get(
+            url, params=params,
+            headers={**(headers or {}), **dump.validators()},
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as resp:
+            if resp.status == 304:
+                dump.touch()
+                log.info(f"{label}: не изменился (304)")
+                return dump.prices
+            if resp.status == 200:
+                prices = await stream_prices(resp.content, prefix, price_key)
+                if not prices:
+                    # Ошибка в JSON или пустой items: прошлый дамп (и его ETag) не затираем
+                    log.warning(f"{label}: 200 без цен — оставляем прошлый дамп")
+                    return dump.prices
+                await dump.store(prices, resp.headers)
+                log.info(f"{label}: {len(prices)} позиций загружено")
+                return prices
+            log.warning(f"{label} HTTP {resp.status}")
+    except Exception as e:
+        log.warning(f"{label}: {e}")
+    return dump.prices
+
 
 BROWSER_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -24,111 +153,98 @@ BROWSER_HEADERS = {
 }
 
 
+# ── Потоковый разбор дампов ───────────────────────────────────────────────────
+async def stream_prices(stream, prefix: str, price_key: str) -> dict[str, float]:
+    """
+    Разбирает JSON-массив объектов по пути prefix прямо из потока ответа
+    и собирает {market_hash_name: price}. Дерево всего дампа не строится:
+    в памяти только текущий элемент и итоговый dict.
+    """
+    prices: dict[str, float] = {}
+    async for i in ijson.items_async(stream, prefix, use_float=True):
+        name, price = i.get("market_hash_name"), i.get(price_key)
+        if name and price:
+            prices[name] = float(price)
+    return prices
+
+
 # ── CSGOMarket ────────────────────────────────────────────────────────────────
 async def fetch_cgm(session: aiohttp.ClientSession) -> dict[str, float]:
-    global _cgm_cache, _cgm_ts
-    if time.time() - _cgm_ts < CACHE_TTL and _cgm_cache:
-        return _cgm_cache
-    try:
-        async with session.get(
-            "https://market.csgo.com/api/v2/prices/USD.json",
-            timeout=aiohttp.ClientTimeout(total=20)
-        ) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                prices = {
-                    i["market_hash_name"]: float(i["price"])
-                    for i in data.get("items", [])
-                    if i.get("market_hash_name") and i.get("price")
-                }
-                _cgm_cache, _cgm_ts = prices, time.time()
-                log.info(f"CSGOMarket: {len(prices)} позиций загружено")
-                return prices
-            log.warning(f"CSGOMarket HTTP {resp.status}")
-    except Exception as e:
-        log.warning(f"CSGOMarket: {e}")
-    return _cgm_cache
+    return await _fetch_dump(
+        session, _cgm, "CSGOMarket",
+        "https://market.csgo.com/api/v2/prices/USD.json",
+        "items.item", "price", timeout=20,
+    )
 
 
 # ── Skinport ──────────────────────────────────────────────────────────────────
 async def fetch_skinport(session: aiohttp.ClientSession) -> dict[str, float]:
-    global _sp_cache, _sp_ts
-    if time.time() - _sp_ts < CACHE_TTL and _sp_cache:
-        return _sp_cache
-    try:
-        async with session.get(
-            "https://api.skinport.com/v1/items",
-            params={"app_id": 730, "currency": "USD", "tradable": 0},
-            headers=BROWSER_HEADERS,
-            timeout=aiohttp.ClientTimeout(total=30),
-        ) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                prices = {
-                    i["market_hash_name"]: float(i["min_price"])
-                    for i in data
-                    if i.get("market_hash_name") and i.get("min_price")
-                }
-                _sp_cache, _sp_ts = prices, time.time()
-                log.info(f"Skinport: {len(prices)} позиций загружено")
-                return prices
-            log.warning(f"Skinport HTTP {resp.status}")
-    except Exception as e:
-        log.warning(f"Skinport: {e}")
-    return _sp_cache
+    return await _fetch_dump(
+        session, _sp, "Skinport",
+        "https://api.skinport.com/v1/items",
+        "item", "min_price", timeout=30,
+        params={"app_id": 730, "currency": "USD", "tradable": 0},
+        headers=BROWSER_HEADERS,
+    )
 
 
 # ── Steam (поштучно, осторожно с rate limit) ──────────────────────────────────
+class SteamRateLimited(Exception):
+    """Steam ответил 429 — паузу выбирает вызывающий."""
+
+
+class SteamUnavailable(Exception):
+    """Сеть, таймаут или ошибка Steam: цена неизвестна, а не «лотов нет»."""
+
+
+# name -> (цена или None, когда устареет — time.time())
+_steam_cache: dict[str, tuple[float | None, float]] = {}
+
+
+def steam_prices() -> dict[str, float]:
+    """Последние известные цены Steam (включая устаревшие — лучше, чем ничего)."""
+    return {name: price for name, (price, _) in _steam_cache.items() if price}
+
+
+def steam_due(name: str, now: float) -> bool:
+    entry = _steam_cache.get(name)
+    return entry is None or entry[1] <= now
+
+
+def remember_steam(name: str, price: float | None, ttl: float, now: float):
+    _steam_cache[name] = (price, now + ttl)
+
+
+def postpone_steam(name: str, ttl: float, now: float):
+    """Запрос не удался: прежнюю цену оставляем, повторим через ttl."""
+    price, _ = _steam_cache.get(name, (None, 0.0))
+    _steam_cache[name] = (price, now + ttl)
+
+
 async def fetch_steam_price(session: aiohttp.ClientSession, name: str) -> float | None:
+    """
+    Цена лучшего лота на Steam в USD; None — лотов нет. На 429 бросает
+    SteamRateLimited, на прочие сбои — SteamUnavailable.
+    """
     try:
         async with session.get(
             "https://steamcommunity.com/market/priceoverview/",
             params={"appid": 730, "currency": 1, "market_hash_name": name},
             timeout=aiohttp.ClientTimeout(total=10),
         ) as resp:
-            if resp.status == 200:
-                d = await resp.json()
-                if d.get("success"):
-                    raw = d.get("lowest_price", "").replace("$", "").replace(",", "").strip()
-                    return float(raw) if raw else None
-            elif resp.status == 429:
-                await asyncio.sleep(5)
-    except Exception:
-        pass
-    return None
-
-
-# ── Арбитраж калькулятор ──────────────────────────────────────────────────────
-FEES = {
-    "cgm":      0.07,
-    "skinport": 0.12,
-    "steam":    0.15,
-}
-
-def calc_arbitrage(buy_price: float, market_prices: dict) -> dict:
-    results = {}
-    labels = {"cgm": "CSGOMarket (-7%)", "skinport": "Skinport (-12%)", "steam": "Steam (-15%)"}
-
-    for platform, price in market_prices.items():
-        if not price:
-            continue
-        fee    = FEES.get(platform, 0.1)
-        sell   = round(price * (1 - fee), 2)
-        profit = round(sell - buy_price, 2)
-        roi    = round(profit / buy_price * 100, 1) if buy_price > 0 else 0
-        results[platform] = {
-            "label":  labels.get(platform, platform),
-            "price":  price,
-            "sell":   sell,
-            "profit": profit,
-            "roi":    roi,
-        }
-
-    best = max(results, key=lambda k: results[k]["roi"]) if results else None
-    best_roi = results[best]["roi"] if best else 0
-
-    return {
-        "platforms":     results,
-        "best_platform": best,
-        "best_roi":      best_roi,
-    }
\ No newline at end of file
+            if resp.status == 429:
+                raise SteamRateLimited(name)
+            if resp.status != 200:
+                raise SteamUnavailable(f"{name}: HTTP {resp.status}")
+            d = await resp.json(content_type=None)
+    except (SteamRateLimited, SteamUnavailable):
+        raise
+    except Exception as e:
+        raise SteamUnavailable(f"{name}: {e!r}") from e
+    if not d or not d.get("success"):
+        return None
+    raw = (d.get("lowest_price") or "").replace("$", "").replace(",", "").strip()
+    try:
+        return float(raw) if raw else None
+    except ValueError:
+        raise SteamUnavailable(f"{name}: цена {raw!r}")
@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket: rate запросов в секунду, всплеск до burst.
+    Токен резервируется сразу при acquire (баланс может уйти в минус),
+    поэтому ready_in() честно учитывает уже стоящих в очереди.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate   = rate
+        self.burst  = burst
+        self.tokens = float(burst)
+        self.ts     = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def ready_in(self) -> float:
+        """Через сколько секунд освободится следующий токен."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
@@ -0,0 +1,145 @@
+"""
+Помесячное range-партиционирование price_history (только Postgres).
+
+price_history — секционированная по recorded_at таблица с партициями
+price_history_pYYYYMM. Партиции создаются на HISTORY_PARTITIONS_AHEAD
+месяцев вперёд, устаревшие целиком удаляются DROP TABLE — без DELETE,
+без раздувания индексов и долгого VACUUM.
+
+Старая несекционированная таблица при первом старте переименовывается
+в price_history_legacy и подключается партицией «всё до начала
+следующего месяца»; удаляется по retention, когда устареет её граница.
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import get_settings
+
+log = logging.getLogger("partitions")
+
+TABLE  = "price_history"
+LEGACY = "price_history_legacy"
+LOCK_ID = 7_310_001   # pg_advisory_xact_lock: API и воркеры стартуют одновременно
+
+_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def month_start(ts: datetime, shift: int = 0) -> datetime:
+    m = ts.year * 12 + ts.month - 1 + shift
+    return datetime(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{TABLE}_p{start:%Y%m}"
+
+
+async def _relkind(conn: AsyncConnection, name: str) -> str | None:
+    res = await conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:n)"), {"n": name}
+    )
+    kind = res.scalar_one_or_none()
+    return kind.decode() if isinstance(kind, bytes) else kind
+
+
+async def ensure_partitioned(conn: AsyncConnection):
+    """Превращает обычную price_history в секционированную. Идемпотентно."""
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID})
+    if await _relkind(conn, TABLE) != "r":
+        return
+
+    has_rows = (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {TABLE})"))).scalar()
+    for sql in (
+        f"ALTER TABLE {TABLE} RENAME TO {LEGACY}",
+        f"ALTER TABLE {LEGACY} RENAME CONSTRAINT {TABLE}_pkey TO {LEGACY}_pkey",
+        f"ALTER INDEX IF EXISTS ix_{TABLE}_item_ts RENAME TO ix_{LEGACY}_item_ts",
+        f"ALTER INDEX IF EXISTS ix_{TABLE}_recorded_at RENAME TO ix_{LEGACY}_recorded_at",
+        # Тот же sequence: id продолжают старую нумерацию
+        f"""CREATE TABLE {TABLE} (
+                id          INTEGER NOT NULL DEFAULT nextval('{TABLE}_id_seq'),
+                item_id     INTEGER NOT NULL,
+                platform    SMALLINT NOT NULL,
+                price_usd   DOUBLE PRECISION NOT NULL,
+                recorded_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                PRIMARY KEY (id, recorded_at)
+            ) PARTITION BY RANGE (recorded_at)""",
+        f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id",
+        f"CREATE INDEX ix_{TABLE}_item_ts ON {TABLE} (item_id, recorded_at)",
+        f"CREATE INDEX ix_{TABLE}_recorded_at ON {TABLE} (recorded_at)",
+    ):
+        await conn.execute(text(sql))
+
+    if has_rows:
+        # Текущий месяц дописывается в legacy, новые партиции — со следующего
+        bound = month_start(datetime.utcnow(), 1)
+        await conn.execute(text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{bound:%Y-%m-%d}')"
+        ))
+        log.info(f"🗂 {TABLE} секционирована, старые данные — партиция {LEGACY} до {bound:%Y-%m-%d}")
+    else:
+        await conn.execute(text(f"DROP TABLE {LEGACY}"))
+        log.info(f"🗂 {TABLE} секционирована")
+
+
+async def _partitions(conn: AsyncConnection) -> list[tuple[str, datetime | None]]:
+    """(имя, верхняя граница) всех партиций; None — граница не разобрана."""
+    res = await conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t)"
+    ), {"t": TABLE})
+    out = []
+    for name, bound in res.all():
+        m = _BOUND_RE.search(bound or "")
+        out.append((name, datetime.fromisoformat(m.group(1)) if m else None))
+    return out
+
+
+async def create_partitions(conn: AsyncConnection, ahead: int | None = None) -> int:
+    """Создаёт помесячные партиции от текущего месяца на ahead месяцев вперёд."""
+    if ahead is None:
+        ahead = get_settings().HISTORY_PARTITIONS_AHEAD
+    covered = max((b for _, b in await _partitions(conn) if b), default=None)
+    now = datetime.utcnow()
+    created = 0
+    for shift in range(ahead + 1):
+        start, end = month_start(now, shift), month_start(now, shift + 1)
+        if covered and end <= covered:
+            continue   # месяц уже покрыт (в т.ч. legacy-партицией)
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+        created += 1
+    return created
+
+
+async def drop_expired_partitions(conn: AsyncConnection,
+                                  retention_days: int | None = None) -> list[str]:
+    """Удаляет партиции, все строки которых старше retention_days (0 — хранить всё)."""
+    if retention_days is None:
+        retention_days = get_settings().HISTORY_RETENTION_DAYS
+    if retention_days <= 0:
+        return []
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    dropped = []
+    for name, upper in await _partitions(conn):
+        if upper is not None and upper <= cutoff:
+            await conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    if dropped:
+        log.info(f"🗑 История старше {retention_days} дн.: удалены {', '.join(dropped)}")
+    return dropped
+
+
+async def maintain_partitions(conn: AsyncConnection):
+    """Партиции вперёд + retention. Без секционирования (не Postgres) — ничего."""
+    if conn.dialect.name != "postgresql" or await _relkind(conn, TABLE) != "p":
+        return
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID})
+    await create_partitions(conn)
+    await drop_expired_partitions(conn)
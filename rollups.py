@@ -0,0 +1,144 @@
+"""
+Свёртки истории цен: часовые и дневные OHLC (+ сумма и число точек для
+среднего) по каждой позиции и площадке.
+
+Поддерживаются инкрементально: коллекторы вливают в свёртки ту же пачку
+точек, что пишут в price_history, в той же транзакции — одним
+INSERT ... ON CONFLICT DO UPDATE на разрешение. Источник — те же точки
+истории (изменения цены + heartbeat), поэтому объём записи свёрток не
+больше объёма записи самой истории.
+
+Разовая перестройка по всей price_history (после деплоя, при
+остановленных воркерах):  python -m rollups
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import PriceHistory, PriceRollup1h, PriceRollup1d
+from ingest import _insert_for, encode_history
+
+log = logging.getLogger("rollups")
+
+UPSERT_CHUNK = 1000
+BACKFILL_BATCH = 50_000
+
+# Разрешения от мелкого к крупному: (ключ, шаг, модель)
+RESOLUTIONS = (
+    ("1h", timedelta(hours=1), PriceRollup1h),
+    ("1d", timedelta(days=1),  PriceRollup1d),
+)
+
+# Столько корзин должно попасть в период, чтобы разрешение годилось для графика
+MIN_POINTS = 30
+
+
+def bucket_start(ts: datetime, step: timedelta) -> datetime:
+    if step >= timedelta(days=1):
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def pick_resolution(period: timedelta):
+    """Самое крупное разрешение, дающее не меньше MIN_POINTS точек; None — сырые точки."""
+    for key, step, model in reversed(RESOLUTIONS):
+        if period / step >= MIN_POINTS:
+            return key, step, model
+    return None
+
+
+def _aggregate(records: list[tuple], step: timedelta) -> list[dict]:
+    """records (item_id, код площадки, price, ts) по возрастанию ts → строки свёртки."""
+    acc: dict[tuple, dict] = {}
+    for item_id, platform, price, ts in records:
+        key = (item_id, platform, bucket_start(ts, step))
+        row = acc.get(key)
+        if row is None:
+            acc[key] = {"item_id": item_id, "platform": platform, "bucket": key[2],
+                        "open": price, "high": price, "low": price, "close": price,
+                        "sum_price": price, "count": 1}
+        else:
+            if price > row["high"]: row["high"] = price
+            if price < row["low"]:  row["low"]  = price
+            row["close"] = price
+            row["sum_price"] += price
+            row["count"] += 1
+    return list(acc.values())
+
+
+async def upsert_rollups(db: AsyncSession, records: list[tuple]) -> int:
+    """
+    Вливает точки истории (name, platform, price, ts) во все свёртки.
+    Коммит — на стороне вызывающего.
+    """
+    if not records:
+        return 0
+    return await _upsert_encoded(db, await encode_history(db, records))
+
+
+async def _upsert_encoded(db: AsyncSession, records: list[tuple]) -> int:
+    sqlite = db.bind.dialect.name == "sqlite"
+    greatest = func.max if sqlite else func.greatest
+    least    = func.min if sqlite else func.least
+    insert = _insert_for(db)
+    records = sorted(records, key=lambda r: r[3])
+    written = 0
+    for _, step, model in RESOLUTIONS:
+        table = model.__table__
+        c = table.c
+        stmt = insert(table)
+        ex = stmt.excluded
+        # Одна скомпилированная команда на все строки (executemany / insertmanyvalues)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.item_id, c.platform, c.bucket],
+            set_={
+                "high":      greatest(c.high, ex.high),
+                "low":       least(c.low, ex.low),
+                "close":     ex.close,
+                "sum_price": c.sum_price + ex.sum_price,
+                "count":     c.count + ex.count,
+            },
+        )
+        rows = _aggregate(records, step)
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            await db.execute(stmt, rows[i:i + UPSERT_CHUNK])
+        written += len(rows)
+    return written
+
+
+async def rebuild_rollups(db: AsyncSession) -> int:
+    """Перестраивает свёртки с нуля по всей price_history. Коммит — на вызывающем."""
+    for _, _, model in RESOLUTIONS:
+        await db.execute(delete(model))
+    total = 0
+    stream = await db.stream(
+        select(PriceHistory.item_id, PriceHistory.platform,
+               PriceHistory.price_usd, PriceHistory.recorded_at)
+        .order_by(PriceHistory.recorded_at)
+        .execution_options(yield_per=BACKFILL_BATCH)
+    )
+    async for part in stream.partitions():
+        await _upsert_encoded(db, [tuple(r) for r in part])
+        total += len(part)
+        log.info(f"свёртки: {total} точек")
+    return total
+
+
+async def _main():
+    from database import AsyncSessionLocal, init_db
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        total = await rebuild_rollups(db)
+        await db.commit()
+    log.info(f"✅ Свёртки перестроены по {total} точкам истории")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+    )
+    asyncio.run(_main())
@@ -1,17 +1,75 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 from typing import Optional
+import base64
+import json
+import logging
+import time
+import zlib
 
-from database import (get_db, User, AccessKey, ArbitrageSnapshot,
+import numpy as np
+import orjson
+
+from database import (get_db, User, AccessKey,
                       PriceHistory, Alert, Position, Trade)
-from auth import get_user_by_tg, is_owner, create_access_key, activate_key
+from auth import (is_owner, create_access_key, activate_key,
+                  verify_init_data, user_cache, CachedUser)
+from config import get_settings
+from market_store import market_store, SORT_KEYS
+from rollups import pick_resolution, bucket_start
+from items import directory, PLATFORM_NAMES
+from downsample import lttb
+from parsers.arbitrage import FEES
+
+settings = get_settings()
+log = logging.getLogger("routes")
 
 # ── Shared dependency ─────────────────────────────────────────────────────────
-async def current_user(tg_id: int, db: AsyncSession = Depends(get_db)) -> User:
-    user = await get_user_by_tg(db, tg_id)
+# Запросы без подписи при WEBAPP_AUTH_REQUIRED=false: выкатку можно закончить,
+# когда счётчик в /health перестанет расти
+unsigned_requests = 0
+_unsigned_users: set[int] = set()   # tg_id, о которых уже написали в лог
+
+def _note_unsigned(tg_id: int):
+    global unsigned_requests
+    unsigned_requests += 1
+    if tg_id not in _unsigned_users and len(_unsigned_users) < 10_000:
+        _unsigned_users.add(tg_id)
+        log.warning(f"tg_id={tg_id}: запрос без подписи Telegram (WEBAPP_AUTH_REQUIRED=false)")
+
+def _check_signed(tg_id: int, signed: str | None):
+    if signed is None:
+        if settings.WEBAPP_AUTH_REQUIRED:
+            raise HTTPException(401, "Открой приложение из Telegram")
+        _note_unsigned(tg_id)
+        return
+    if verify_init_data(signed) != tg_id:
+        raise HTTPException(403, "Подпись Telegram не сошлась")
+
+async def webapp_auth(tg_id: int, x_telegram_init_data: Optional[str] = Header(None)):
+    """
+    На каждом роутере: tg_id из query должен совпасть с подписанным
+    Telegram initData из заголовка X-Telegram-Init-Data.
+    """
+    _check_signed(tg_id, x_telegram_init_data)
+
+async def stream_auth(tg_id: int, x_telegram_init_data: Optional[str] = Header(None),
+                      init_data: Optional[str] = Query(None)):
+    """
+    Только для /arbitrage/stream: EventSource заголовков ставить не умеет,
+    та же строка initData — параметром init_data. В URL она попадает в логи
+    доступа, поэтому больше нигде этот канал не принимается.
+    """
+    _check_signed(tg_id, x_telegram_init_data or init_data)
+
+
+async def current_user(tg_id: int, db: AsyncSession = Depends(get_db)) -> CachedUser:
+    # Из кэша процесса: при тёплом кэше — ни одного запроса к БД
+    user = await user_cache.get(db, tg_id)
     if not user or not user.access_key:
         raise HTTPException(403, "Нет доступа. Активируй ключ через /activate в боте")
     return user
@@ -20,7 +78,7 @@ async def current_user(tg_id: int, db: AsyncSession = Depends(get_db)) -> User:
 # ===========================================================================
 # USERS
 # ===========================================================================
-users = APIRouter()
+users = APIRouter(dependencies=[Depends(webapp_auth)])
 
 class SettingsIn(BaseModel):
     usd_rub:        Optional[float] = None
@@ -30,7 +88,7 @@ class SettingsIn(BaseModel):
 
 @users.get("/me")
 async def get_me(tg_id: int, db: AsyncSession = Depends(get_db)):
-    user = await get_user_by_tg(db, tg_id)
+    user = await user_cache.get(db, tg_id)
     if not user:
         raise HTTPException(404, "Не найден")
     buff_age = None
@@ -41,7 +99,7 @@ async def get_me(tg_id: int, db: AsyncSession = Depends(get_db)):
         "username":       user.username,
         "role":           user.role,
         "has_access":     bool(user.access_key),
-        "has_buff":       bool(user.buff_session),
+        "has_buff":       user.has_buff,
         "buff_age_days":  buff_age,
         "buff_expiring":  buff_age is not None and buff_age >= 10,
         "usd_rub":        user.usd_rub,
@@ -54,11 +112,12 @@ async def get_me(tg_id: int, db: AsyncSession = Depends(get_db)):
 @users.patch("/settings")
 async def update_settings(tg_id: int, body: SettingsIn, db: AsyncSession = Depends(get_db)):
     user = await current_user(tg_id, db)
-    if body.usd_rub        is not None: user.usd_rub        = body.usd_rub
-    if body.notify_tg      is not None: user.notify_tg      = body.notify_tg
-    if body.notify_app     is not None: user.notify_app     = body.notify_app
-    if body.min_roi_notify is not None: user.min_roi_notify = body.min_roi_notify
-    await db.commit()
+    changes = body.model_dump(exclude_none=True)
+    if changes:
+        # Один UPDATE вместо повторной загрузки юзера в сессию
+        await db.execute(update(User).where(User.id == user.id).values(**changes))
+        await db.commit()
+        user_cache.invalidate(tg_id)
     return {"ok": True}
 
 @users.get("/keys")
@@ -81,161 +140,290 @@ async def gen_key(tg_id: int, db: AsyncSession = Depends(get_db)):
 # ===========================================================================
 # ARBITRAGE
 # ===========================================================================
-arbitrage = APIRouter()
-
-import re as _re
-
-def _normalize_icon(icon_url: str | None) -> str | None:
-    """Всегда возвращает /api/img?p=HASH, независимо от формата в БД."""
-    if not icon_url:
-        return None
-    # Уже правильный формат
-    if icon_url.startswith("/api/img"):
-        return icon_url
-    # Старый формат: полный Steam CDN URL
-    m = _re.search(r"/economy/image/([^/?]+)", icon_url)
-    if m:
-        return f"/api/img?p={m.group(1)}"
-    return icon_url
-
-FEES = {"cgm": 0.07, "skinport": 0.12, "steam": 0.15}
+arbitrage = APIRouter(dependencies=[Depends(webapp_auth)])
+
+# Готовые тела ответа по (поколение рынка, фильтры, курсы): повторный опрос
+# между тиками — без БД и без сборки списка, с совпавшим If-None-Match —
+# пустой 304
+_BOOT = f"{int(time.time()):x}"   # ETag не совпадёт с выданным до рестарта
+_list_cache: dict[tuple, tuple[dict, bytes]] = {}   # -> (заголовки, тело)
+_list_generation = -1
+
+def _rates(user: CachedUser) -> tuple[float, float]:
+    return user.cny_usd or 0.138, user.usd_rub or 90.0
+
+def _list_etag(generation: int, key: tuple) -> str:
+    digest = zlib.crc32(repr(key).encode())
+    return f'"{_BOOT}-{generation}-{digest:08x}"'
+
+def _etag_matches(etag: str, if_none_match: str | None) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+# Курсор — ключ последней позиции страницы в порядке sort (market_store.SORT_KEYS)
+def _encode_cursor(sort: str, key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode().rstrip("=")
+
+def _decode_cursor(sort: str, cursor: str) -> tuple:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value, name = float(raw[1]), str(raw[2])
+    except (ValueError, TypeError, IndexError):
+        raise HTTPException(400, "Неверный курсор")
+    if raw[0] != sort:
+        raise HTTPException(400, "Курсор от другой сортировки")
+    return value, name
 
 @arbitrage.get("/list")
 async def list_arb(tg_id: int, min_roi: float = 0, sort: str = "roi",
+                   cursor: Optional[str] = None, limit: Optional[int] = None,
+                   price_min: Optional[float] = None, price_max: Optional[float] = None,
+                   liquidity: Optional[str] = None, platform: Optional[str] = None,
+                   is_unstable: Optional[bool] = None, exclude_unstable: bool = False,
+                   q: Optional[str] = None,
+                   if_none_match: Optional[str] = Header(None),
                    db: AsyncSession = Depends(get_db)):
-    user = await current_user(tg_id, db)
-    cny_usd = user.cny_usd or 0.138
-    usd_rub = user.usd_rub or 90.0
-    cny_rub = cny_usd * usd_rub
-
-    res = await db.execute(
-        select(ArbitrageSnapshot).where(ArbitrageSnapshot.best_roi >= min_roi)
-    )
-    snaps = res.scalars().all()
-
-    # Загружаем историю цен за 24ч для определения нестабильности
-    since_24h = datetime.utcnow() - timedelta(hours=24)
-    hist_res = await db.execute(
-        select(PriceHistory)
-        .where(PriceHistory.platform == "buff", PriceHistory.recorded_at >= since_24h)
-        .order_by(PriceHistory.recorded_at)
-    )
-    hist_rows = hist_res.scalars().all()
-
-    # Строим dict: name -> (oldest_price, newest_price) за 24ч
-    price_24h: dict = {}
-    for h in hist_rows:
-        if h.name not in price_24h:
-            price_24h[h.name] = {"first": h.price_usd, "last": h.price_usd}
-        else:
-            price_24h[h.name]["last"] = h.price_usd
-
-    items = []
-    for s in snaps:
-        platforms = {}
-        for pkey, price in [("cgm", s.cgm_price), ("skinport", s.skinport_price), ("steam", s.steam_price)]:
-            if not price: continue
-            fee     = FEES.get(pkey, 0.07)
-            net_usd = price * (1 - fee)
-            net_cny = net_usd / cny_usd if cny_usd else 0
-            profit  = net_usd - (s.buff_price or 0)
-            roi     = profit / (s.buff_price or 1) * 100
-            platforms[pkey] = {
-                "label":      {"cgm": "CSGOMarket (-7%)", "skinport": "Skinport (-12%)", "steam": "Steam (-15%)"}[pkey],
-                "sell_price": round(price, 2),
-                "net_usd":    round(net_usd, 2),
-                "net_cny":    round(net_cny, 0),
-                "net_rub":    round(net_usd * usd_rub, 0),
-                "profit_usd": round(profit, 2),
-                "profit_cny": round(profit / cny_usd if cny_usd else 0, 0),
-                "profit_rub": round(profit * usd_rub, 0),
-                "roi":        round(roi, 1),
-            }
-
-        # ── АЛГОРИТМ СТАБИЛЬНОСТИ ──────────────────────────────────────
-        ph = price_24h.get(s.name)
-        price_change_24h = None
+    """
+    Страница списка в порядке sort (roi | price | updated). Следующая —
+    с cursor из заголовка X-Next-Cursor; заголовка нет — страница последняя.
+    liquidity — через запятую (high,med,low), q — подстрока имени,
+    exclude_unstable=true — то же, что is_unstable=false.
+    """
+    global _list_generation
+    if sort not in SORT_KEYS:
+        raise HTTPException(400, f"sort: {' | '.join(SORT_KEYS)}")
+    limit = max(1, min(limit or settings.LIST_PAGE_SIZE, settings.LIST_PAGE_MAX))
+    if exclude_unstable:
         is_unstable = False
-        unstable_reasons = []
-
-        # 1. Рост цены Buff за 24ч > 50% → PUMP
-        if ph and ph["first"] > 0:
-            price_change_24h = round((ph["last"] - ph["first"]) / ph["first"] * 100, 1)
-            if price_change_24h > 50:
-                is_unstable = True
-                unstable_reasons.append("pump_24h")
-
-        # 2. Мало продавцов + высокий ROI → кто-то один выставил по нереальной цене
-        #    Gut Knife 1 продавец ROI 125% — классика этого кейса
-        best_roi_val = max((v["roi"] for v in platforms.values()), default=0)
-        if s.buff_sell_num < 3 and best_roi_val > 25:
-            is_unstable = True
-            unstable_reasons.append("low_supply_high_roi")
-
-        # 3. Аномально высокий ROI при небольшом числе продавцов
-        #    Если ROI > 60% и продавцов < 10 — с вероятностью 90% это выброс
-        if best_roi_val > 60 and s.buff_sell_num < 10:
-            is_unstable = True
-            unstable_reasons.append("abnormal_roi")
-
-        # 4. ROI > 40% при нулевом спросе (покупателей < 2) — продать не выйдет
-        if best_roi_val > 40 and s.buff_buy_num < 2:
-            is_unstable = True
-            unstable_reasons.append("no_demand")
-
-        buff_cny = (s.buff_price or 0) / cny_usd if cny_usd else 0
-        liq = "high" if s.buff_sell_num > 50 else ("med" if s.buff_sell_num > 15 else "low")
-        items.append({
-            "name":             s.name,
-            "icon_url":         _normalize_icon(s.icon_url),
-            "buff_price":       s.buff_price,
-            "buff_price_cny":   round(buff_cny, 0),
-            "buff_price_rub":   round((s.buff_price or 0) * usd_rub, 0),
-            "best_roi":         s.best_roi,
-            "best_sell":        s.best_sell_platform,
-            "sell_num":         s.buff_sell_num,
-            "buy_num":          s.buff_buy_num,
-            "liquidity":        liq,
-            "price_change_24h": price_change_24h,
-            "is_unstable":      is_unstable,
-            "unstable_reason":  unstable_reasons[0] if unstable_reasons else None,
-            "platforms":        platforms,
-            "updated_at":       s.updated_at.isoformat(),
-        })
-
-    if sort == "roi":     items.sort(key=lambda x: x["best_roi"], reverse=True)
-    elif sort == "price": items.sort(key=lambda x: x["buff_price"] or 0)
-    return items
+    query = (min_roi, sort, cursor, limit, price_min, price_max,
+             liquidity, platform, is_unstable, q)
+
+    # Курсы (а с ними и проверка доступа) — из кэша юзеров, БД не трогаем
+    user = user_cache.peek(tg_id)
+    if user is not None and user.access_key and market_store.ready:
+        etag = _list_etag(market_store.generation, (*query, _rates(user)))
+        if _etag_matches(etag, if_none_match):
+            return Response(status_code=304, headers={"ETag": etag})
+    rates = _rates(await current_user(tg_id, db))
+
+    # Рынок и производные уже посчитаны в памяти; БД — только если процесс
+    # ещё не успел его загрузить
+    await market_store.ensure_loaded(db)
+    generation = market_store.generation
+    if generation != _list_generation:
+        _list_cache.clear()
+        _list_generation = generation
+    key = (*query, rates)
+    hit = _list_cache.get(key)
+    if hit is None:
+        items, last = market_store.page(
+            sort, _decode_cursor(sort, cursor) if cursor else None, limit,
+            min_roi=min_roi, price_min=price_min, price_max=price_max,
+            liquidity=set(liquidity.split(",")) if liquidity else None,
+            platform=platform, unstable=is_unstable, q=q,
+        )
+        # Тело — склейка готовых фрагментов позиций (market_store.MarketItem.fragment)
+        body = b"[" + b",".join(it.fragment(*rates) for it in items) + b"]"
+        headers = {"ETag": _list_etag(generation, key), "Cache-Control": "no-cache"}
+        if last is not None:
+            headers["X-Next-Cursor"] = _encode_cursor(sort, last)
+        if len(_list_cache) >= settings.LIST_CACHE_SIZE:
+            _list_cache.pop(next(iter(_list_cache)))
+        hit = _list_cache[key] = (headers, body)
+    headers, body = hit
+    if _etag_matches(headers["ETag"], if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# ── Поток изменений (SSE) ─────────────────────────────────────────────────────
+# snapshot — все позиции с best_roi >= min_roi, дальше delta после каждого
+# поколения рынка: {"upsert": [позиции], "remove": [имена]}. id события —
+# поколение; EventSource при переподключении шлёт его в Last-Event-ID, и если
+# журнал market_store его ещё помнит, клиент получает одну дельту вместо снапшота
+def _sse(event: str, generation: int, data: bytes) -> bytes:
+    return b"event: %s\nid: %s-%d\ndata: %s\n\n" % (event.encode(), _BOOT.encode(), generation, data)
+
+def _parse_event_id(event_id: str | None) -> int | None:
+    boot, _, generation = (event_id or "").rpartition("-")
+    if boot != _BOOT or not generation.isdigit():
+        return None
+    return int(generation)
+
+async def _arb_events(request: Request, min_roi: float, rates: tuple, resume: int | None):
+    def visible() -> list:
+        return market_store.page("roi", None, len(market_store.items) + 1, min_roi=min_roi)[0]
+
+    generation = market_store.generation
+    delta = market_store.changes_since(resume) if resume is not None else None
+    if delta is None:
+        items = visible()
+        yield _sse("snapshot", generation,
+                   b"[" + b",".join(it.fragment(*rates) for it in items) + b"]")
+        sent = {it.name for it in items}
+    else:
+        # Что у клиента, неизвестно: невидимым из изменившихся шлём remove все
+        sent = set(market_store.items) | delta[1]
+
+    while True:
+        if delta is None:
+            if not await market_store.wait_change(generation, settings.STREAM_PING):
+                if await request.is_disconnected():
+                    return
+                yield b": ping\n\n"
+                continue
+            delta = market_store.changes_since(generation)
+            generation = market_store.generation
+            if delta is None:
+                # Отстали дальше журнала — заново снапшот
+                items = visible()
+                yield _sse("snapshot", generation,
+                           b"[" + b",".join(it.fragment(*rates) for it in items) + b"]")
+                sent = {it.name for it in items}
+                continue
+
+        changed, removed = delta
+        delta = None
+        upsert, remove = [], [n for n in removed if n in sent]
+        for name in changed:
+            it = market_store.get(name)
+            if (it.best_roi or 0) >= min_roi:
+                upsert.append(it.fragment(*rates))
+                sent.add(name)
+            elif name in sent:
+                remove.append(name)
+        sent -= set(remove)
+        if resume is not None:
+            sent, resume = {it.name for it in visible()}, None
+        if upsert or remove:
+            yield _sse("delta", generation,
+                       b'{"upsert":[' + b",".join(upsert) + b'],"remove":' + orjson.dumps(remove) + b"}")
+
+# Отдельный роутер под тем же префиксом /api/arbitrage: своя проверка подписи
+stream = APIRouter(dependencies=[Depends(stream_auth)])
+
+@stream.get("/stream")
+async def stream_arb(request: Request, tg_id: int, min_roi: float = 0,
+                     last_event_id: Optional[str] = Header(None),
+                     db: AsyncSession = Depends(get_db)):
+    """
+    Server-Sent Events вместо опроса /list: снапшот, затем только изменения.
+    Подпись Telegram — параметром init_data (EventSource без заголовков):
+    new EventSource(`/api/arbitrage/stream?tg_id=…&init_data=${encodeURIComponent(initData)}`)
+    """
+    rates = _rates(await current_user(tg_id, db))
+    await market_store.ensure_loaded(db)
+    return StreamingResponse(
+        _arb_events(request, min_roi, rates, _parse_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ===========================================================================
 # CHARTS
 # ===========================================================================
-charts = APIRouter()
+charts = APIRouter(dependencies=[Depends(webapp_auth)])
 
 PERIOD_DAYS = {"1д": 1, "7д": 7, "30д": 30, "90д": 90}
+CHART_MAX_POINTS = 1000   # потолок точек на площадку, даже без points
 
-@charts.get("/history")
-async def get_history(tg_id: int, name: str, period: str = "7д",
-                      db: AsyncSession = Depends(get_db)):
-    await current_user(tg_id, db)
-    since = datetime.utcnow() - timedelta(days=PERIOD_DAYS.get(period, 7))
+async def _raw_history(db: AsyncSession, item_id: int, since: datetime) -> dict:
+    """{platform: [(ts, price, None)]} по сырым точкам price_history."""
+    heartbeat = timedelta(seconds=settings.HISTORY_HEARTBEAT)
     res = await db.execute(
-        select(PriceHistory)
-        .where(PriceHistory.name == name, PriceHistory.recorded_at >= since)
+        select(PriceHistory.platform, PriceHistory.recorded_at, PriceHistory.price_usd)
+        .where(PriceHistory.item_id == item_id, PriceHistory.recorded_at >= since)
+        .order_by(PriceHistory.recorded_at)
+    )
+    rows = res.all()
+    # Цена на начало окна — последняя точка до него (heartbeat гарантирует,
+    # что она не старше heartbeat)
+    head_res = await db.execute(
+        select(PriceHistory.platform, PriceHistory.price_usd)
+        .where(PriceHistory.item_id == item_id,
+               PriceHistory.recorded_at >= since - heartbeat,
+               PriceHistory.recorded_at < since)
         .order_by(PriceHistory.recorded_at)
     )
-    rows = res.scalars().all()
+    by_platform: dict = {PLATFORM_NAMES[p]: [(since, price, None)] for p, price in head_res.all()}
+    for platform, ts, price in rows:
+        by_platform.setdefault(PLATFORM_NAMES[platform], []).append((ts, price, None))
+    return by_platform
+
+
+async def _rollup_history(db: AsyncSession, item_id: int, since: datetime,
+                          step: timedelta, model) -> dict:
+    """{platform: [(bucket, close, ohlc)]} по свёртке нужного разрешения."""
+    res = await db.execute(
+        select(model)
+        .where(model.item_id == item_id, model.bucket >= bucket_start(since, step))
+        .order_by(model.bucket)
+    )
     by_platform: dict = {}
-    for r in rows:
-        by_platform.setdefault(r.platform, []).append({"ts": r.recorded_at.isoformat(), "price": r.price_usd})
+    for r in res.scalars():
+        by_platform.setdefault(PLATFORM_NAMES[r.platform], []).append((r.bucket, r.close, {
+            "open": r.open, "high": r.high, "low": r.low,
+            "avg":  round(r.sum_price / r.count, 2) if r.count else r.close,
+        }))
     return by_platform
 
 
+@charts.get("/history")
+async def get_history(tg_id: int, name: str, period: str = "7д",
+                      points: Optional[int] = Query(None, ge=3, le=CHART_MAX_POINTS),
+                      db: AsyncSession = Depends(get_db)):
+    await current_user(tg_id, db)
+    now = datetime.utcnow()
+    span = timedelta(days=PERIOD_DAYS.get(period, 7))
+    since = now - span
+
+    item_id = await directory.id_of(db, name)
+    if item_id is None:
+        return {}
+
+    # Длинные периоды — из часовой/дневной свёртки (точки с OHLC), короткие — сырые
+    resolution = pick_resolution(span)
+    if resolution is None:
+        step = timedelta(seconds=settings.HISTORY_HEARTBEAT)
+        by_platform = await _raw_history(db, item_id, since)
+    else:
+        _, step, model = resolution
+        by_platform = await _rollup_history(db, item_id, since, step, model)
+
+    # Точки пишутся только при изменении цены: между ними цена постоянна.
+    # Текущую цену знает рынок в памяти — хвост тянем до «сейчас»; площадку,
+    # которой там нет, — не дальше следующего heartbeat (конца корзины)
+    item = market_store.get(name)
+    current = item.prices() if item else {}
+    limit = points or CHART_MAX_POINTS
+    out: dict = {}
+    for platform, series in by_platform.items():
+        last_ts, last_price, _ = series[-1]
+        if platform in current:
+            if now > last_ts:
+                series.append((now, current[platform], None))
+        else:
+            tail = min(now, last_ts + step)
+            if tail > last_ts:
+                series.append((tail, last_price, None))
+        # Длинный ряд прореживаем LTTB: форма кривой та же, точек — не больше limit
+        if len(series) > limit:
+            keep = lttb(np.fromiter((ts.timestamp() for ts, _, _ in series), float, len(series)),
+                        np.fromiter((price for _, price, _ in series), float, len(series)),
+                        limit)
+            series = [series[i] for i in keep]
+        out[platform] = [{"ts": ts.isoformat(), "price": price, **(ohlc or {})}
+                         for ts, price, ohlc in series]
+    return out
+
+
 # ===========================================================================
 # ALERTS
 # ===========================================================================
-alerts = APIRouter()
+alerts = APIRouter(dependencies=[Depends(webapp_auth)])
 
 class AlertIn(BaseModel):
     skin_name: str
@@ -279,7 +467,7 @@ async def delete_alert(tg_id: int, alert_id: int, db: AsyncSession = Depends(get
 # ===========================================================================
 # PORTFOLIO
 # ===========================================================================
-portfolio = APIRouter()
+portfolio = APIRouter(dependencies=[Depends(webapp_auth)])
 
 class PositionIn(BaseModel):
     skin_name:     str
@@ -340,9 +528,8 @@ async def del_position(tg_id: int, pos_id: int, db: AsyncSession = Depends(get_d
 # ===========================================================================
 # TRADES
 # ===========================================================================
-trades = APIRouter()
+trades = APIRouter(dependencies=[Depends(webapp_auth)])
 
-TRADE_FEES = {"cgm": 0.07, "skinport": 0.12, "steam": 0.15, "csfloat": 0.02}
 
 class TradeIn(BaseModel):
     skin_name:      str
@@ -399,7 +586,7 @@ async def add_trade(tg_id: int, body: TradeIn, db: AsyncSession = Depends(get_db
     user = await current_user(tg_id, db)
     profit = roi = None
     if body.sell_price_usd and body.sell_platform:
-        fee     = TRADE_FEES.get(body.sell_platform, 0.07)
+        fee     = FEES.get(body.sell_platform, 0.07)
         net     = body.sell_price_usd * (1 - fee)
         profit  = round((net - body.buy_price_usd) * body.quantity, 2)
         roi     = round(profit / (body.buy_price_usd * body.quantity) * 100, 1)
@@ -0,0 +1,95 @@
+"""
+Адаптивное расписание поштучного обновления цен Buff.
+
+Полный обход каталога (parsers/crawler.py) освежает каждую позицию раз
+в цикл. Часть бюджета запросов уходит сюда: на позиции, где свежая цена
+важнее всего. Приоритет = возраст цены × (1 + волатильность + ROI +
+близость к порогам активных алертов).
+"""
+import heapq
+import math
+import statistics
+from collections import deque
+
+PRICE_WINDOW = 12     # последних цен на позицию для оценки волатильности
+TARGET_AGE   = 300    # «нормальный» возраст цены, с — масштаб для старения
+MIN_INTERVAL = 30     # чаще этого одну позицию не трогаем
+
+W_VOL   = 50.0        # вес коэффициента вариации цены (0.02 → +1)
+W_ROI   = 2.0         # вес ROI (50% → +1)
+W_ALERT = 4.0         # вес близости к порогу алерта (на пороге → +4)
+
+ALERT_ROI_SCALE   = 5.0    # п.п. ROI до порога, на которых близость падает в e раз
+ALERT_PRICE_SCALE = 0.05   # доля цены до порога, на которой близость падает в e раз
+
+
+class ItemState:
+    __slots__ = ("item", "prices", "best_roi", "refreshed")
+
+    def __init__(self, item: dict, best_roi: float, refreshed: float):
+        self.item      = item
+        self.prices    = deque(maxlen=PRICE_WINDOW)
+        self.best_roi  = best_roi
+        self.refreshed = refreshed
+
+
+class RefreshScheduler:
+    def __init__(self):
+        self.items: dict[str, ItemState] = {}
+        # name -> [(condition, value)] активных алертов
+        self.alerts: dict[str, list[tuple[str, float]]] = {}
+
+    def observe(self, item: dict, best_roi: float, ts: float):
+        """Запоминает свежие данные позиции (из обхода или поштучного обновления)."""
+        if not item.get("id"):
+            return
+        st = self.items.get(item["name"])
+        if st is None:
+            st = self.items[item["name"]] = ItemState(item, best_roi, ts)
+        st.item, st.best_roi, st.refreshed = item, best_roi, ts
+        st.prices.append(item["price_usd"])
+
+    def set_alerts(self, rows):
+        """rows — (skin_name, condition, value) активных алертов."""
+        alerts: dict[str, list[tuple[str, float]]] = {}
+        for name, condition, value in rows:
+            if value is not None and condition in ("roi_gt", "price_lt"):
+                alerts.setdefault(name, []).append((condition, value))
+        self.alerts = alerts
+
+    # ── Приоритет ─────────────────────────────────────────────────────────────
+    @staticmethod
+    def volatility(st: ItemState) -> float:
+        if len(st.prices) < 2:
+            return 0.0
+        mean = statistics.fmean(st.prices)
+        return statistics.pstdev(st.prices) / mean if mean > 0 else 0.0
+
+    def alert_closeness(self, name: str, st: ItemState) -> float:
+        """0..1: насколько позиция близка к срабатыванию любого из алертов."""
+        best = 0.0
+        for condition, value in self.alerts.get(name, ()):
+            if condition == "roi_gt":
+                gap = max(0.0, value - st.best_roi) / ALERT_ROI_SCALE
+            else:
+                price = st.item["price_usd"]
+                gap = max(0.0, price - value) / max(value, 1e-9) / ALERT_PRICE_SCALE
+            best = max(best, math.exp(-gap))
+        return best
+
+    def priority(self, name: str, st: ItemState, now: float) -> float:
+        age = now - st.refreshed
+        if age < MIN_INTERVAL:
+            return 0.0
+        boost = (W_VOL * self.volatility(st)
+                 + W_ROI * max(st.best_roi, 0.0) / 100
+                 + W_ALERT * self.alert_closeness(name, st))
+        return age / TARGET_AGE * (1 + boost)
+
+    def pick(self, k: int, now: float) -> list[ItemState]:
+        """k позиций с наибольшим приоритетом."""
+        if k <= 0:
+            return []
+        scored = ((self.priority(name, st, now), name) for name, st in self.items.items())
+        top = heapq.nlargest(k, (x for x in scored if x[0] > 0))
+        return [self.items[name] for _, name in top]
@@ -0,0 +1,94 @@
+"""
+Классификатор стабильности позиции: эвристики, отмечающие цены, на
+которые нельзя полагаться (памп, один продавец по нереальной цене,
+нет спроса).
+
+Считается один раз на позицию в коллекторе и лежит в снапшоте:
+is_unstable, unstable_mask (биты сработавших правил) и
+unstable_confidence. Путь запроса только читает готовое.
+
+Новое правило — функция Facts -> bool под @rule со свободным битом.
+Биты уже лежат в БД: занятые не переиспользовать.
+"""
+from typing import Callable, NamedTuple
+
+
+class Facts(NamedTuple):
+    buff_price: float
+    first_24h:  float | None   # цена Buff на начало 24ч окна (item_stats)
+    best_roi:   float
+    sell_num:   int
+    buy_num:    int
+
+    @property
+    def change_24h(self) -> float | None:
+        if not self.first_24h or self.first_24h <= 0:
+            return None
+        return round((self.buff_price - self.first_24h) / self.first_24h * 100, 1)
+
+
+class Rule(NamedTuple):
+    reason:     str
+    bit:        int
+    confidence: float   # вероятность, что сработавшее правило право
+    check:      Callable[[Facts], bool]
+
+
+RULES: list[Rule] = []   # в порядке приоритета причины
+
+
+def rule(reason: str, bit: int, confidence: float):
+    def register(check: Callable[[Facts], bool]):
+        if any(r.bit == bit or r.reason == reason for r in RULES):
+            raise ValueError(f"правило {reason} / бит {bit} уже занято")
+        RULES.append(Rule(reason, bit, confidence, check))
+        return check
+    return register
+
+
+def classify(facts: Facts) -> tuple[int, float]:
+    """
+    (маска сработавших правил, уверенность). Уверенность — noisy-OR по
+    сработавшим: 1 - П(1 - confidence); 0.0 — позиция стабильна.
+    """
+    mask, trust = 0, 1.0
+    for r in RULES:
+        if r.check(facts):
+            mask |= 1 << r.bit
+            trust *= 1 - r.confidence
+    return mask, round(1 - trust, 3)
+
+
+def reasons(mask: int | None) -> list[str]:
+    """Причины по маске в порядке приоритета."""
+    if not mask:
+        return []
+    return [r.reason for r in RULES if mask >> r.bit & 1]
+
+
+# ── Правила ───────────────────────────────────────────────────────────────────
+# 1. Рост цены Buff за 24ч > 50% → PUMP
+@rule("pump_24h", bit=0, confidence=0.8)
+def _pump(f: Facts) -> bool:
+    change = f.change_24h
+    return change is not None and change > 50
+
+
+# 2. Мало продавцов + высокий ROI → кто-то один выставил по нереальной цене
+#    Gut Knife 1 продавец ROI 125% — классика этого кейса
+@rule("low_supply_high_roi", bit=1, confidence=0.7)
+def _low_supply(f: Facts) -> bool:
+    return f.sell_num < 3 and f.best_roi > 25
+
+
+# 3. Аномально высокий ROI при небольшом числе продавцов
+#    Если ROI > 60% и продавцов < 10 — с вероятностью 90% это выброс
+@rule("abnormal_roi", bit=2, confidence=0.9)
+def _abnormal_roi(f: Facts) -> bool:
+    return f.best_roi > 60 and f.sell_num < 10
+
+
+# 4. ROI > 40% при нулевом спросе (покупателей < 2) — продать не выйдет
+@rule("no_demand", bit=3, confidence=0.6)
+def _no_demand(f: Facts) -> bool:
+    return f.best_roi > 40 and f.buy_num < 2
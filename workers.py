@@ -1,22 +1,49 @@
 import asyncio
+import heapq
 import logging
+import random
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 import aiohttp
 from sqlalchemy import select
 
-from database import (AsyncSessionLocal, ArbitrageSnapshot, PriceHistory,
+from database import (AsyncSessionLocal, ArbitrageSnapshot,
                       Alert, User, Position)
-from parsers.buff import fetch_buff_page, fetch_cny_usd_rate
-from parsers.markets import fetch_cgm, fetch_skinport
-from parsers.arbitrage import calc_arbitrage, liquidity_label
+from config import get_settings
+from parsers.buff import fetch_buff_page, fetch_buff_item, fetch_cny_usd_rate
+from parsers.crawler import BuffCrawler, parse_categories
+from parsers.buff_pool import BuffSessionPool
+from parsers.markets import (fetch_cgm, fetch_skinport, fetch_steam_price, SteamRateLimited,
+                             SteamUnavailable, steam_prices, steam_due, remember_steam,
+                             postpone_steam)
+from parsers.ratelimit import RateLimiter
+from parsers.arbitrage import best_from_buff, liquidity_label
+from ingest import (upsert_snapshots, insert_history, select_history, forget_written,
+                    update_steam_prices, bump_generation)
+from market_store import market_store
+from rollups import upsert_rollups
+from item_stats import update_item_stats, rolling
+from scheduler import RefreshScheduler
+from stability import Facts, classify
 
 log = logging.getLogger("workers")
 
+COLLECT_INTERVAL = 300  # период тика коллектора, с
+
 _cny_usd: float = 0.138
 _cny_updated: float = 0.0
 
+# Общие для коллектора и hot_refresher: одни куки — один бюджет запросов
+_pool = BuffSessionPool(get_settings().BUFF_RPS, burst=get_settings().BUFF_CONCURRENCY)
+_scheduler = RefreshScheduler()
+
+# Коллектор, hot_refresher и steam_collector пишут одни и те же строки
+# снапшотов, item_stats/роллапы и единственную строку market_state: по одной
+# транзакции за раз — без взаимных блокировок в Postgres, и откат одного
+# (forget_written, rolling.invalidate) не выбрасывает кэши чужой записи на лету
+_write_lock = asyncio.Lock()
+
 
 async def _update_rate(session: aiohttp.ClientSession):
     global _cny_usd, _cny_updated
@@ -28,9 +55,124 @@ async def _update_rate(session: aiohttp.ClientSession):
             log.info(f"CNY/USD = {_cny_usd:.4f}")
 
 
+async def _fetch_buff_legacy(session: aiohttp.ClientSession, pool: BuffSessionPool) -> list[dict]:
+    """Старый режим: первые 4 страницы ножей подряд."""
+    all_items: list[dict] = []
+    for page in range(1, 5):
+        bs = await pool.acquire()
+        if bs is None:
+            break
+        meta: dict = {}
+        items = await fetch_buff_page(session, bs.cookie, page, _cny_usd, meta=meta)
+        pool.report(bs, meta["status"])
+        if meta["status"] != "ok" or not items:
+            break
+        all_items.extend(items)
+        await asyncio.sleep(2)
+    return all_items
+
+
+async def _sync_buff_pool(pool: BuffSessionPool):
+    """Подтягивает в пул куки всех юзеров с Buff сессией."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(User.tg_id, User.buff_session).where(User.buff_session.isnot(None))
+        )
+        pool.sync({tg_id: cookie for tg_id, cookie in result.all()})
+
+
+def _classify(rows: list[dict], stats: dict[str, dict] | None = None):
+    """Проставляет строкам снапшотов поля стабильности (stability.py)."""
+    for row in rows:
+        name = row["name"]
+        it = market_store.get(name)
+        st = stats.get(name) if stats else None
+        first = st["first_24h"] if st else (it.first_24h if it else None)
+        # Частичные строки (Steam) берут недостающее из рынка в памяти
+        buff     = row.get("buff_price", it.buff_price if it else None) or 0
+        sell_num = row.get("buff_sell_num", it.buff_sell_num if it else 0) or 0
+        buy_num  = row.get("buff_buy_num", it.buff_buy_num if it else 0) or 0
+        mask, confidence = classify(Facts(buff, first, row["best_roi"], sell_num, buy_num))
+        row.update(is_unstable=bool(mask), unstable_mask=mask, unstable_confidence=confidence)
+
+
+async def _persist_items(all_items: list[dict], cgm_prices: dict, sp_prices: dict,
+                         label: str = "✅"):
+    """Считает арбитраж по свежим позициям Buff и пишет снапшоты + историю."""
+    settings = get_settings()
+    now = datetime.utcnow()
+    snapshot_rows: list[dict] = []
+    history_rows: list[tuple] = []
+    st_prices = steam_prices()
+
+    price_rows = [{"buff": item["price_usd"], "cgm": cgm_prices.get(item["name"]),
+                   "skinport": sp_prices.get(item["name"]), "steam": st_prices.get(item["name"])}
+                  for item in all_items]
+    for item, prices, (best, best_roi) in zip(all_items, price_rows, best_from_buff(price_rows)):
+        name = item["name"]
+        buff_usd = item["price_usd"]
+        cgm_usd, sp_usd = prices["cgm"], prices["skinport"]
+
+        snapshot_rows.append(dict(
+            name=name, buff_goods_id=item.get("id") or None,
+            icon_url=item["icon_url"], buff_price=buff_usd,
+            cgm_price=cgm_usd, skinport_price=sp_usd,
+            buff_sell_num=item["sell_num"], buff_buy_num=item["buy_num"],
+            best_roi=best_roi, best_sell_platform=best,
+            updated_at=now,
+        ))
+        _scheduler.observe(item, best_roi, time.time())
+
+        history_rows.append((name, "buff", buff_usd, now))
+        if cgm_usd: history_rows.append((name, "cgm",      cgm_usd, now))
+        if sp_usd:  history_rows.append((name, "skinport", sp_usd,  now))
+
+    observed = len(history_rows)
+    async with _write_lock:
+        history_rows = select_history(history_rows, settings.HISTORY_EPSILON,
+                                      settings.HISTORY_HEARTBEAT)
+
+        t0 = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            try:
+                # Статистика — до снапшотов: классификатору нужна цена на начало 24ч окна
+                stats = await update_item_stats(db, history_rows)
+                _classify(snapshot_rows, stats)
+                written = await upsert_snapshots(db, snapshot_rows)
+                t1 = time.perf_counter()
+                await insert_history(db, history_rows)
+                await upsert_rollups(db, history_rows)
+                generation = await bump_generation(db)
+                t2 = time.perf_counter()
+                await db.commit()
+            except Exception:
+                forget_written()
+                rolling.invalidate()
+                raise
+        t3 = time.perf_counter()
+        for row in snapshot_rows:
+            st = stats.get(row["name"])
+            if st is not None:
+                row["first_24h"] = st["first_24h"]
+        market_store.apply(snapshot_rows, generation)
+    log.info(f"{label} {len(snapshot_rows)} позиций, {written} снапшотов изменено, "
+             f"{len(history_rows)}/{observed} точек истории | запись {(t3 - t0) * 1000:.0f} мс "
+             f"(снапшоты {(t1 - t0) * 1000:.0f}, история {(t2 - t1) * 1000:.0f}, "
+             f"commit {(t3 - t2) * 1000:.0f})")
+
+
 async def price_collector():
     """Каждые 5 минут: парсит Buff + CGM + Skinport, пишет историю цен."""
     log.info("📊 price_collector started")
+    settings = get_settings()
+    crawler = None
+    if settings.BUFF_FULL_CATALOG:
+        # Доля BUFF_HOT_SHARE бюджета отдана поштучным обновлениям (hot_refresher)
+        crawler = BuffCrawler(
+            parse_categories(settings.BUFF_CATEGORIES),
+            pages_per_tick=max(1, round(settings.BUFF_PAGES_PER_TICK * (1 - settings.BUFF_HOT_SHARE))),
+            concurrency=settings.BUFF_CONCURRENCY,
+        )
     async with aiohttp.ClientSession() as session:
         while True:
             try:
@@ -38,70 +180,229 @@ async def price_collector():
                 cgm_prices = await fetch_cgm(session)
                 sp_prices  = await fetch_skinport(session)
 
-                async with AsyncSessionLocal() as db:
-                    result = await db.execute(
-                        select(User).where(User.buff_session.isnot(None)).limit(1)
-                    )
-                    u = result.scalar_one_or_none()
-
-                if not u:
-                    log.warning("Нет пользователей с Buff сессией — пропускаем")
-                    await asyncio.sleep(300)
+                await _sync_buff_pool(_pool)
+                if not len(_pool):
+                    log.warning("Нет живых Buff сессий — пропускаем")
+                    await asyncio.sleep(COLLECT_INTERVAL)
                     continue
 
-                all_items: list[dict] = []
-                for page in range(1, 5):
-                    items = await fetch_buff_page(session, u.buff_session, page, _cny_usd)
-                    if not items:
-                        break
-                    all_items.extend(items)
-                    await asyncio.sleep(2)
+                if crawler:
+                    all_items = await crawler.tick(session, _pool, _cny_usd)
+                    if crawler.session_expired:
+                        log.warning("Все Buff сессии протухли посреди обхода")
+                else:
+                    all_items = await _fetch_buff_legacy(session, _pool)
 
                 log.info(f"Buff: {len(all_items)} позиций")
-                now = datetime.utcnow()
-                history_rows: list = []
+                await _persist_items(all_items, cgm_prices, sp_prices)
+
+            except Exception as e:
+                log.error(f"price_collector: {e}", exc_info=True)
+
+            await asyncio.sleep(COLLECT_INTERVAL)
+
 
-                async with AsyncSessionLocal() as db:
-                    for item in all_items:
-                        name = item["name"]
-                        buff_usd = item["price_usd"]
-                        cgm_usd  = cgm_prices.get(name)
-                        sp_usd   = sp_prices.get(name)
+async def _seed_scheduler():
+    """После рестарта поднимает в планировщик позиции, уже известные по БД."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ArbitrageSnapshot).where(ArbitrageSnapshot.buff_goods_id.isnot(None))
+        )
+        for s in result.scalars():
+            _scheduler.observe({
+                "id": s.buff_goods_id, "name": s.name, "price_usd": s.buff_price or 0,
+                "sell_num": s.buff_sell_num, "buy_num": s.buff_buy_num,
+                "icon_url": s.icon_url,
+            }, s.best_roi, s.updated_at.replace(tzinfo=timezone.utc).timestamp())
+    log.info(f"🔥 Планировщик: {len(_scheduler.items)} позиций из БД")
 
-                        markets = {}
-                        if cgm_usd: markets["cgm"]     = cgm_usd
-                        if sp_usd:  markets["skinport"] = sp_usd
 
-                        arb = calc_arbitrage(buff_usd, markets, u.usd_rub)
+async def _refresh_item(session: aiohttp.ClientSession, sem: asyncio.Semaphore,
+                        st) -> dict | None:
+    async with sem:
+        bs = await _pool.acquire()
+        if bs is None:
+            return None
+        meta: dict = {}
+        fresh = await fetch_buff_item(session, bs.cookie, st.item["id"], _cny_usd, meta)
+        _pool.report(bs, meta["status"])
+    if not fresh:
+        return None
+    # Лоты на продажу не знают про спрос и иногда про имя/иконку — берём прошлые
+    prev = st.item
+    fresh["name"] = prev["name"]
+    if fresh["buy_num"] is None:
+        fresh["buy_num"] = prev.get("buy_num") or 0
+    fresh["icon_url"] = fresh["icon_url"] or prev.get("icon_url")
+    return fresh
 
+
+async def hot_refresher():
+    """
+    Каждые BUFF_HOT_INTERVAL секунд поштучно обновляет самые приоритетные
+    позиции. Тратит долю BUFF_HOT_SHARE того же бюджета, что и обход,
+    и через те же token bucket'ы пула — общий поток запросов не растёт.
+    """
+    settings = get_settings()
+    if not settings.BUFF_FULL_CATALOG or settings.BUFF_HOT_SHARE <= 0:
+        return
+    log.info("🔥 hot_refresher started")
+    try:
+        await _seed_scheduler()
+    except Exception as e:
+        log.error(f"hot_refresher: {e}")
+
+    per_round = (settings.BUFF_PAGES_PER_TICK * settings.BUFF_HOT_SHARE
+                 * settings.BUFF_HOT_INTERVAL / COLLECT_INTERVAL)
+    credit = 0.0
+    alerts_loaded = 0.0
+    async with aiohttp.ClientSession() as session:
+        while True:
+            await asyncio.sleep(settings.BUFF_HOT_INTERVAL)
+            try:
+                if time.time() - alerts_loaded > 60:
+                    async with AsyncSessionLocal() as db:
                         res = await db.execute(
-                            select(ArbitrageSnapshot).where(ArbitrageSnapshot.name == name)
-                        )
-                        snap = res.scalar_one_or_none()
-                        data = dict(
-                            icon_url=item["icon_url"], buff_price=buff_usd,
-                            cgm_price=cgm_usd, skinport_price=sp_usd,
-                            buff_sell_num=item["sell_num"], buff_buy_num=item["buy_num"],
-                            best_roi=arb["best_roi"], best_sell_platform=arb["best"],
-                            updated_at=now,
+                            select(Alert.skin_name, Alert.condition, Alert.value)
+                            .where(Alert.active == True)
                         )
-                        if snap:
-                            for k, v in data.items(): setattr(snap, k, v)
-                        else:
-                            db.add(ArbitrageSnapshot(name=name, **data))
+                        _scheduler.set_alerts(res.all())
+                    alerts_loaded = time.time()
 
-                        history_rows.append(PriceHistory(name=name, platform="buff",     price_usd=buff_usd, recorded_at=now))
-                        if cgm_usd: history_rows.append(PriceHistory(name=name, platform="cgm",      price_usd=cgm_usd, recorded_at=now))
-                        if sp_usd:  history_rows.append(PriceHistory(name=name, platform="skinport", price_usd=sp_usd,  recorded_at=now))
-
-                    db.add_all(history_rows)
-                    await db.commit()
-                    log.info(f"✅ {len(all_items)} снапшотов, {len(history_rows)} точек истории")
+                if not len(_pool):
+                    continue
+                # Дробный бюджет копится между раундами
+                credit = min(credit + per_round * len(_pool), per_round * len(_pool) * 3)
+                picked = _scheduler.pick(int(credit), time.time())
+                if not picked:
+                    continue
+                credit -= len(picked)
 
+                sem = asyncio.Semaphore(settings.BUFF_CONCURRENCY * len(_pool))
+                fresh = await asyncio.gather(*(_refresh_item(session, sem, st) for st in picked))
+                items = [f for f in fresh if f]
+                if items:
+                    cgm_prices = await fetch_cgm(session)
+                    sp_prices  = await fetch_skinport(session)
+                    await _persist_items(items, cgm_prices, sp_prices, label="🔥")
             except Exception as e:
-                log.error(f"price_collector: {e}", exc_info=True)
+                log.error(f"hot_refresher: {e}", exc_info=True)
+
+
+STEAM_BATCH       = 20    # цен Steam на одну запись в БД
+STEAM_BACKOFF_MAX = 900   # потолок паузы после 429, с
+STEAM_RETRY       = 300   # после сбоя запроса цену перепроверяем через, с
+
+
+def _steam_ttl(best_roi: float) -> float:
+    """Прибыльные позиции перепроверяем чаще, убыточные — реже."""
+    base = get_settings().STEAM_TTL
+    if best_roi >= 20: return base / 4
+    if best_roi >= 0:  return base
+    return base * 4
+
+
+async def _seed_steam():
+    """Поднимает цены Steam из снапшотов; сроки жизни размазаны, чтобы не рефрешить всё разом."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ArbitrageSnapshot.name, ArbitrageSnapshot.steam_price, ArbitrageSnapshot.best_roi)
+            .where(ArbitrageSnapshot.steam_price.isnot(None))
+        )
+        now = time.time()
+        for name, price, roi in result.all():
+            remember_steam(name, price, random.uniform(0, _steam_ttl(roi)), now)
+
+
+async def _write_steam(results: dict[str, float | None]):
+    """Пишет цены Steam в снапшоты, пересчитывая лучший ROI с учётом Steam."""
+    settings = get_settings()
+    await market_store.ensure_loaded()
+    # ROI — по ценам рынка под тем же замком, что и запись: Buff-запись
+    # не вклинится между расчётом и UPDATE
+    async with _write_lock:
+        known = [(name, price, it) for name, price in results.items()
+                 if (it := market_store.get(name)) is not None]
+        best = best_from_buff([{"buff": it.buff_price, "cgm": it.cgm_price,
+                                "skinport": it.skinport_price, "steam": price}
+                               for _, price, it in known])
+        rows = [dict(name=name, steam_price=price, best_roi=roi, best_sell_platform=platform)
+                for (name, price, _), (platform, roi) in zip(known, best)]
+        _classify(rows)
+        now = datetime.utcnow()
+        history = select_history(
+            [(name, "steam", price, now) for name, price in results.items() if price],
+            settings.HISTORY_EPSILON, settings.HISTORY_HEARTBEAT,
+        )
+        async with AsyncSessionLocal() as db:
+            try:
+                await update_steam_prices(db, rows)
+                await insert_history(db, history)
+                await upsert_rollups(db, history)
+                generation = await bump_generation(db)
+                await db.commit()
+            except Exception:
+                forget_written()
+                raise
+        market_store.apply(rows, generation)
+
+
+async def steam_collector():
+    """
+    Фоном обходит позиции по убыванию ROI и заполняет steam_price.
+    Строгий общий лимит STEAM_RPS, на 429 — экспоненциальная пауза,
+    у каждой цены свой срок жизни (_steam_ttl). Тик коллектора не ждёт Steam.
+    """
+    settings = get_settings()
+    if settings.STEAM_RPS <= 0:
+        return
+    log.info("🎮 steam_collector started")
+    limiter = RateLimiter(settings.STEAM_RPS)
+    backoff = 0.0
+    try:
+        await _seed_steam()
+        if not _scheduler.items:
+            await _seed_scheduler()
+    except Exception as e:
+        log.error(f"steam_collector: {e}")
+
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                now = time.time()
+                due = [(st.best_roi, name) for name, st in _scheduler.items.items()
+                       if steam_due(name, now)]
+                if not due:
+                    await asyncio.sleep(60)
+                    continue
+
+                results: dict[str, float | None] = {}
+                for roi, name in heapq.nlargest(STEAM_BATCH, due):
+                    await limiter.acquire()
+                    try:
+                        price = await fetch_steam_price(session, name)
+                    except SteamRateLimited:
+                        backoff = min(STEAM_BACKOFF_MAX, backoff * 2 or 60)
+                        log.warning(f"Steam 429 — пауза {backoff:.0f}с")
+                        break
+                    except SteamUnavailable as e:
+                        # Сбой — не «лотов нет»: известную цену в снапшотах не трогаем
+                        log.debug(f"Steam: {e}")
+                        postpone_steam(name, STEAM_RETRY, time.time())
+                        continue
+                    remember_steam(name, price, _steam_ttl(roi), time.time())
+                    results[name] = price
+                else:
+                    backoff = 0.0
 
-            await asyncio.sleep(300)
+                if results:
+                    await _write_steam(results)
+                    log.info(f"🎮 Steam: {len(results)} цен, в очереди {len(due) - len(results)}")
+                if backoff:
+                    await asyncio.sleep(backoff)
+            except Exception as e:
+                log.error(f"steam_collector: {e}", exc_info=True)
+                await asyncio.sleep(60)
 
 
 async def alert_checker():
@@ -109,16 +410,17 @@ async def alert_checker():
     log.info("🔔 alert_checker started")
     while True:
         try:
+            await market_store.ensure_loaded()
             async with AsyncSessionLocal() as db:
                 result = await db.execute(
-                    select(Alert, User, ArbitrageSnapshot)
+                    select(Alert, User)
                     .join(User, Alert.user_id == User.id)
-                    .join(ArbitrageSnapshot, Alert.skin_name == ArbitrageSnapshot.name, isouter=True)
                     .where(Alert.active == True)
                 )
                 rows = result.all()
 
-            for alert, user, snap in rows:
+            for alert, user in rows:
+                snap = market_store.get(alert.skin_name)
                 if not snap: continue
                 triggered = False
                 if   alert.condition == "roi_gt"   and alert.value: triggered = snap.best_roi >= alert.value
@@ -161,6 +463,20 @@ async def portfolio_checker():
         await asyncio.sleep(3600)
 
 
+async def history_maintainer():
+    """Раз в сутки: партиции price_history наперёд и удаление устаревших."""
+    from database import engine
+    from partitions import maintain_partitions
+    log.info("🗂 history_maintainer started")
+    while True:
+        try:
+            async with engine.begin() as conn:
+                await maintain_partitions(conn)
+        except Exception as e:
+            log.error(f"history_maintainer: {e}")
+        await asyncio.sleep(86400)
+
+
 async def buff_cookie_checker():
     """Раз в сутки предупреждает об истечении Buff куки."""
     log.info("🍪 buff_cookie_checker started")
@@ -183,7 +499,27 @@ async def buff_cookie_checker():
 async def start_workers():
     await asyncio.gather(
         price_collector(),
+        hot_refresher(),
+        steam_collector(),
         alert_checker(),
         portfolio_checker(),
         buff_cookie_checker(),
+        history_maintainer(),
+    )
+
+
+async def run_standalone():
+    """Отдельный процесс воркеров: коллекторы, чекеры и бот без API."""
+    from database import init_db
+    from bot.bot import start_bot
+    await init_db()
+    log.info("✅ Воркеры и бот запущены отдельным процессом")
+    await asyncio.gather(start_workers(), start_bot(), market_store.follow())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
     )
+    asyncio.run(run_standalone())